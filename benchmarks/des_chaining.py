@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+""" Measures how the DES block chaining functions scale with payload size.
+Run from the repository root with:
+  python3 -m benchmarks.des_chaining """
+
+import argparse
+import secrets
+import time
+
+from final.crypto import DES
+
+
+def parse_size(size):
+  """ Parses a size such as "64K" or "64M".
+  Args:
+    size: The size string.
+  Returns:
+    The size, in bytes. """
+  units = {"K": 1 << 10, "M": 1 << 20}
+  if size[-1].upper() in units:
+    return int(size[:-1]) * units[size[-1].upper()]
+  return int(size)
+
+def run(cipher, size):
+  """ Encrypts a random payload once.
+  Args:
+    cipher: Either "des" or "3des".
+    size: The size of the payload, in bytes.
+  Returns:
+    The elapsed time, in seconds. """
+  data = secrets.token_bytes(size)
+  key1, key2, key3 = [format(secrets.randbits(64), "064b") for _ in range(3)]
+
+  start = time.perf_counter()
+  if cipher == "des":
+    DES.blockChainDES(data, key1, 0)
+  else:
+    DES.blockChainTripleDES(data, key1, key2, key3, 0)
+  return time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser("DES chaining benchmark.")
+  parser.add_argument("--cipher", choices=["des", "3des"], default="des",
+                      help="Which chaining function to measure.")
+  parser.add_argument("--min_size", default="1K",
+                      help="Smallest payload size.")
+  parser.add_argument("--max_size", default="64M",
+                      help="Largest payload size. The sizes in between grow by "
+                           "a factor of four.")
+  args = parser.parse_args()
+
+  size = parse_size(args.min_size)
+  max_size = parse_size(args.max_size)
+
+  print("%12s %12s %12s %14s" % ("bytes", "seconds", "KB/s", "us/block"))
+  while size <= max_size:
+    elapsed = run(args.cipher, size)
+    blocks = size // 8
+    print("%12d %12.3f %12.1f %14.2f" % \
+          (size, elapsed, size / 1024 / elapsed, elapsed * 1e6 / blocks))
+    size *= 4
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+""" Measures TripleDES throughput against the number of worker processes.
+Run from the repository root with:
+  python3 -m benchmarks.des_parallel """
+
+import argparse
+import os
+import secrets
+import time
+
+from final.crypto import DES
+
+
+def run(mode, workers, message):
+  """ Encrypts and decrypts a message once.
+  Args:
+    mode: The TripleDES mode to use.
+    workers: The number of worker processes to use.
+    message: The message to encrypt.
+  Returns:
+    The time taken to encrypt and to decrypt, in seconds. """
+  # A threshold of zero forces the parallel path whenever workers > 1.
+  des = DES.TripleDES(mode, workers, 0)
+  des.gen_key()
+
+  start = time.perf_counter()
+  cipher = des.encrypt(message)
+  middle = time.perf_counter()
+  des.decrypt(cipher)
+  end = time.perf_counter()
+
+  return middle - start, end - middle
+
+
+def main():
+  parser = argparse.ArgumentParser("Parallel TripleDES benchmark.")
+  parser.add_argument("--size", type=int, default=1 << 20,
+                      help="Message size in bytes.")
+  parser.add_argument("--mode", choices=[DES.TripleDES.ECB, DES.TripleDES.CBC,
+                                         DES.TripleDES.CTR],
+                      default=DES.TripleDES.CTR, help="TripleDES mode.")
+  parser.add_argument("--max_workers", type=int, default=os.cpu_count(),
+                      help="Largest number of workers to try.")
+  args = parser.parse_args()
+
+  message = secrets.token_bytes(args.size).decode("latin-1")
+
+  print("%8s %14s %14s" % ("workers", "encrypt KB/s", "decrypt KB/s"))
+  workers = 1
+  while workers <= args.max_workers:
+    # Warm up the pool so process startup is not measured.
+    run(args.mode, workers, message[:8192])
+
+    encrypt_time, decrypt_time = run(args.mode, workers, message)
+    print("%8d %14.1f %14.1f" % (workers, args.size / 1024 / encrypt_time,
+                                 args.size / 1024 / decrypt_time))
+    workers *= 2
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+""" Measures how well the continuous RC4 keystream buffer keeps up with a
+stream of messages, and how often a message has to wait for keystream.
+Run from the repository root with:
+  python3 -m benchmarks.rc4_buffer """
+
+import argparse
+import secrets
+import time
+
+from final.crypto import RC4
+
+
+def run(buffer_size, refill_watermark, message_size, count, interval, warmup):
+  """ Encrypts a sequence of random messages under one key.
+  Args:
+    buffer_size: The size of the keystream buffer, or 0 to not use one.
+    refill_watermark: The refill watermark of the buffer.
+    message_size: The size of each message, in bytes.
+    count: The number of messages.
+    interval: How many seconds to wait between messages, which gives the
+              buffer time to refill.
+    warmup: How many seconds to give the buffer to fill up before timing
+            starts. While it fills, it competes with the messages for the
+            GIL.
+  Returns:
+    The mean time per message in microseconds, and the number of buffer hits
+    and misses. """
+  if buffer_size:
+    cipher = RC4.RC4(256, 768, True, buffer_size, refill_watermark)
+  else:
+    cipher = RC4.RC4(256, 768)
+  cipher.gen_key()
+  message = secrets.token_bytes(message_size)
+
+  # The first message starts the buffer.
+  cipher.encrypt_bytes(message)
+  time.sleep(warmup)
+  start_hits, start_misses = cipher.get_buffer_stats()
+
+  elapsed = 0.0
+  for _ in range(count):
+    start = time.perf_counter()
+    cipher.encrypt_bytes(message)
+    elapsed += time.perf_counter() - start
+    time.sleep(interval)
+
+  hits, misses = cipher.get_buffer_stats()
+  hits -= start_hits
+  misses -= start_misses
+  # Stop the refill thread.
+  cipher.close()
+  return elapsed * 1e6 / count, hits, misses
+
+
+def main():
+  parser = argparse.ArgumentParser("RC4 keystream buffer benchmark.")
+  parser.add_argument("--buffer_size", type=int, default=65536,
+                      help="Size of the keystream buffer, in bytes.")
+  parser.add_argument("--refill_watermark", type=int, default=16384,
+                      help="Refill the buffer below this many bytes.")
+  parser.add_argument("--count", type=int, default=200,
+                      help="Number of messages of each size.")
+  parser.add_argument("--interval", type=float, default=0.001,
+                      help="Seconds to wait between messages.")
+  parser.add_argument("--warmup", type=float, default=0.5,
+                      help="Seconds to let the buffer fill before timing.")
+  args = parser.parse_args()
+
+  print("%10s %12s %14s %8s %8s" % \
+        ("bytes", "buffer", "us/message", "hits", "misses"))
+  for message_size in (64, 1024, 16384):
+    for buffer_size in (0, args.buffer_size):
+      mean, hits, misses = run(buffer_size, args.refill_watermark,
+                               message_size, args.count, args.interval,
+                               args.warmup)
+      print("%10d %12s %14.1f %8d %8d" % \
+            (message_size, buffer_size or "none", mean, hits, misses))
+
+
+if __name__ == "__main__":
+  main()
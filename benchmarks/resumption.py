@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+""" Compares the time taken by a full handshake and by one resumed from a
+session ticket, over the loopback interface. Run from the repository root with:
+  python3 -m benchmarks.resumption """
+
+import argparse
+import socket
+import threading
+import time
+
+from final import config_helper
+from final.transfer import client
+from final.transfer import server
+from final.transfer import tickets
+
+
+def build_manager(pkc):
+  """ Creates a manager that supports a single PKC and RC4.
+  Args:
+    pkc: The PKC to use, either "rsa" or "gm".
+  Returns:
+    The CryptoManager. """
+  config = config_helper.ConfigHelper()
+  if pkc == "rsa":
+    config.add_rsa("config/rsa.json")
+  else:
+    config.add_goldwassermicali("config/gm.json")
+  config.add_rc4("config/rc4.json")
+  return config.get_manager()
+
+def free_port():
+  """
+  Returns:
+    A port that nothing is listening on. """
+  with socket.socket() as sock:
+    sock.bind(("", 0))
+    return sock.getsockname()[1]
+
+def connect(port, pkc, ticket):
+  """ Connects to the server and disconnects again.
+  Args:
+    port: The port that the server is listening on.
+    pkc: The PKC to use.
+    ticket: The ticket to resume from, or None for a full handshake.
+  Returns:
+    The time taken by the handshake in milliseconds, whether the session was
+    resumed, and the ticket for the next connection. """
+  manager = build_manager(pkc)
+  start = time.perf_counter()
+  my_client = client.Client("127.0.0.1", port, manager, ticket=ticket)
+  elapsed = (time.perf_counter() - start) * 1000
+  return elapsed, my_client.is_resumed(), my_client.get_ticket()
+
+
+def main():
+  parser = argparse.ArgumentParser("Session resumption benchmark.")
+  parser.add_argument("--pkc", choices=["rsa", "gm"], default="rsa",
+                      help="The PKC to use for full handshakes.")
+  parser.add_argument("--repeat", type=int, default=20,
+                      help="Number of handshakes of each kind.")
+  args = parser.parse_args()
+
+  port = free_port()
+  my_server = server.Server(port, build_manager(args.pkc),
+                            ticket_cache=tickets.TicketCache())
+  thread = threading.Thread(target=my_server.serve_forever, args=(1,),
+                            daemon=True)
+  thread.start()
+
+  full_times = []
+  resumed_times = []
+  for _ in range(args.repeat):
+    elapsed, _, ticket = connect(port, args.pkc, None)
+    full_times.append(elapsed)
+
+    elapsed, resumed, _ = connect(port, args.pkc, ticket)
+    if not resumed:
+      raise RuntimeError("Server did not accept the ticket.")
+    resumed_times.append(elapsed)
+
+  my_server.shutdown()
+
+  print("%-10s %12s %12s" % ("handshake", "mean ms", "min ms"))
+  for name, times in (("full", full_times), ("resumed", resumed_times)):
+    print("%-10s %12.2f %12.2f" % (name, sum(times) / len(times), min(times)))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+""" Compares the JSON and binary wire formats for every protocol message type.
+Run from the repository root with:
+  python3 -m benchmarks.wire_format """
+
+import argparse
+import secrets
+import time
+
+from final import config_helper
+from final.transfer import protocol_messages as messages
+from final.transfer import wire_format
+
+
+# Largest JSON message that fits in the six digit length prefix.
+JSON_LIMIT = 999999
+
+
+def build_messages(contents_size):
+  """ Creates one message of each type, with realistic encrypted fields.
+  Args:
+    contents_size: The size of the SessionMessage contents, in bytes.
+  Returns:
+    A list of messages. """
+  config = config_helper.ConfigHelper()
+  config.add_rsa("config/rsa.json")
+  config.add_rc4("config/rc4.json")
+  manager = config.get_manager()
+
+  pkcs = manager.get_supported_pkcs()
+  symmetric = manager.get_supported_symmetric()
+  manager.set_algorithms(pkcs[0], symmetric[0])
+  pub_context, _ = manager.get_pkc()
+  session_context = manager.get_symmetric()
+  session_context.gen_key()
+
+  contents = secrets.token_bytes(contents_size).decode("latin-1")
+  return [
+      messages.ClientHello.create(pkc=pkcs, symmetric=symmetric,
+                                  formats=wire_format.SUPPORTED),
+      messages.ServerHello.create(pkc=pkcs[0], symmetric=symmetric[0],
+                                  pub_key=pub_context.get_key(),
+                                  format=wire_format.BINARY),
+      messages.ClientChallenge.create(pub_context,
+          challenge=secrets.token_hex(40), pub_key=pub_context.get_key(),
+          session_key=session_context.get_key(),
+          mac_key=secrets.token_hex(40)),
+      messages.ServerChallenge.create(pub_context, session_context,
+          challenge=secrets.token_hex(40), response=secrets.token_hex(40)),
+      messages.ClientSessionVerify.create(session_context,
+                                          response=secrets.token_hex(40)),
+      messages.SessionMessage.create(session_context, contents=contents)]
+
+def time_per_call(function, repeat):
+  """ Times a function.
+  Args:
+    function: The function to call, with no arguments.
+    repeat: The number of times to call it.
+  Returns:
+    The average time per call, in microseconds. """
+  start = time.perf_counter()
+  for _ in range(repeat):
+    function()
+  return (time.perf_counter() - start) / repeat * 1000000
+
+
+def main():
+  parser = argparse.ArgumentParser("Wire format benchmark.")
+  parser.add_argument("--size", type=int, default=4096,
+                      help="Size of the SessionMessage contents in bytes.")
+  parser.add_argument("--repeat", type=int, default=200,
+                      help="Number of times to run each operation.")
+  args = parser.parse_args()
+
+  print("%-20s %6s %10s %12s %12s" % ("message", "format", "bytes",
+                                      "serialize us", "parse us"))
+  for message in build_messages(args.size):
+    message_type = type(message)
+
+    binary_frame = message.serialize_binary()
+    tag, _ = wire_format.HEADER.unpack_from(binary_frame)
+    binary_body = binary_frame[wire_format.HEADER.size:]
+    results = [
+        (wire_format.BINARY, len(binary_frame),
+         time_per_call(message.serialize_binary, args.repeat),
+         time_per_call(lambda: message_type.deserialize_binary_from(
+                           tag, binary_body), args.repeat))]
+
+    json_frame = message.serialize().encode("utf-8")
+    json_body = json_frame[6:].decode("utf-8")
+    if len(json_body) > JSON_LIMIT:
+      # The length no longer fits in the six digit prefix.
+      print("%-20s %6s %10d %25s" % (message_type.__name__, wire_format.JSON,
+                                     len(json_frame), "too large to send"))
+    else:
+      results.insert(0,
+          (wire_format.JSON, len(json_frame),
+           time_per_call(message.serialize, args.repeat),
+           time_per_call(lambda: message_type.deserialize_from(json_body),
+                         args.repeat)))
+
+    for name, size, serialize_time, parse_time in results:
+      print("%-20s %6s %10d %12.1f %12.1f" % (message_type.__name__, name,
+                                              size, serialize_time,
+                                              parse_time))
+
+
+if __name__ == "__main__":
+  main()
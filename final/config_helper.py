@@ -47,15 +47,27 @@ class ConfigHelper:
     # Load the configuration.
     config = self.__load_config(conf_file)
     key_size = config["key_size"]
+    drop = config["drop"]
+    continuous = config["continuous"]
+    buffer_size = config["buffer_size"]
+    refill_watermark = config["refill_watermark"]
 
-    rc4 = RC4.RC4(key_size)
+    rc4 = RC4.RC4(key_size, drop, continuous, buffer_size, refill_watermark)
     rc4_con = secure_context.SymmetricContext(rc4, self.__nonce_gen,
                                               self.__nonce_ver, self.__mac)
     self.__manager.add_symmetric_context(rc4_con)
 
-  def add_des(self):
-    """ Initializes DES. """
-    des = DES.TripleDES()
+  def add_des(self, conf_file):
+    """ Initializes DES.
+    Args:
+      conf_file: The JSON file to load configuration from. """
+    # Load the configuration.
+    config = self.__load_config(conf_file)
+    mode = config["mode"]
+    workers = config["workers"]
+    parallel_threshold = config["parallel_threshold"]
+
+    des = DES.TripleDES(mode, workers, parallel_threshold)
     des_con = secure_context.SymmetricContext(des, self.__nonce_gen,
                                               self.__nonce_ver, self.__mac)
     self.__manager.add_symmetric_context(des_con)
@@ -1,34 +1,148 @@
 from .cryptosystem import Symmetric
 from bitarray import *
+import concurrent.futures
+import copy
+import functools
 import secrets
+import struct
+import threading
 
 class TripleDES(Symmetric):
-    def __init__(self):
+    #Supported block cipher modes
+    ECB = "ECB"
+    CBC = "CBC"
+    CTR = "CTR"
+
+    def __init__(self, mode=CBC, workers=1, parallel_threshold=262144):
+        """
+        Args:
+            mode (string): The block cipher mode to use. Both ends of a
+                           session must use the same mode.
+            workers (int): The number of processes to spread large messages
+                           over. Only ECB and CTR encryption and ECB, CBC and
+                           CTR decryption can be split up.
+            parallel_threshold (int): Messages shorter than this many bytes
+                                      are always processed in this process. """
+        if mode not in (self.ECB, self.CBC, self.CTR):
+            raise ValueError("Unknown TripleDES mode '%s'." % (mode))
+
         self.keysize = 64
+        self.mode = mode
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
         self.key1 = ""
         self.key2 = ""
         self.key3 = ""
+        #Subkey schedules in the order they are applied, for each mode
+        self.schedules = None
 
     def encrypt(self, message):
-        bitMessage = bitarray()
-        message = message + "ENDMESS"
-        bitMessage.frombytes(message.encode('latin-1'))
+        """ Encrypts a message. In CBC and CTR mode, a random IV is generated
+        and sent as the first block of the ciphertext.
+        Args:
+            message (string): The message to encrypt.
+        Returns:
+            (string) The encrypted message. """
+        return self.encrypt_bytes(message.encode("latin-1")).decode("latin-1")
+
+    def encrypt_bytes(self, message):
+        """ Encrypts a message without converting it to a string.
+        Args:
+            message (bytes-like): The message to encrypt.
+        Returns:
+            (bytes-like) The encrypted message. """
+        if self.mode == self.CTR:
+            #CTR is a stream mode, so it does not need padding
+            iv = secrets.token_bytes(8)
+            return iv + self.__crypt(message, self.schedules[0], iv)
 
-        #Add padding to the end of messages so that the blocks are 64
-        if(len(bitMessage)%64 != 0):
-            for i in range(64 - (len(bitMessage)%64) ):
-                bitMessage.insert(len(bitMessage), 0)
+        padded = _pad(message)
+        if self.mode == self.ECB:
+            return self.__crypt(padded, self.schedules[0])
 
-        cipher = blockChainTripleDES(bitMessage, self.key1, self.key2, self.key3, 0)
-        return cipher.tobytes().decode("latin-1")
+        iv = secrets.token_bytes(8)
+        return iv + _cbcEncrypt(padded, _triple_crypt_block, self.schedules[0],
+                                iv)
 
     def decrypt(self, message):
-        cipher = bitarray()
-        cipher.frombytes(message.encode("latin-1"))
-        plaintext = blockChainTripleDES(cipher, self.key1, self.key2, self.key3, 1)
-        decoded = plaintext.tobytes().decode('latin-1')
-        indexOfEnd = decoded.find("ENDMESS")
-        return decoded[:indexOfEnd]
+        """ Decrypts a message.
+        Args:
+            message (string): The message to decrypt.
+        Returns:
+            (string) The decrypted message. """
+        return self.decrypt_bytes(message.encode("latin-1")).decode("latin-1")
+
+    def decrypt_bytes(self, message):
+        """ Decrypts a message without converting it to a string.
+        Args:
+            message (bytes-like): The message to decrypt.
+        Returns:
+            (bytes-like) The decrypted message. """
+        if self.mode == self.CTR:
+            return self.decrypt_range_bytes(message, 0, len(message) - 8)
+
+        if self.mode == self.ECB:
+            padded = self.__crypt(message, self.schedules[1])
+        else:
+            view = memoryview(message)
+            padded = self.__crypt(view[8:], self.schedules[1], view[:8])
+            view.release()
+
+        return _unpad(padded)
+
+    def decrypt_range(self, message, offset, length):
+        """ Decrypts part of a message without touching the rest of it. This is
+        only possible in CTR mode.
+        Args:
+            message (string): The full encrypted message.
+            offset (int): The offset in the plaintext to start decrypting at.
+            length (int): The number of characters to decrypt.
+        Returns:
+            (string) The decrypted part of the message. """
+        data = message.encode("latin-1")
+        return self.decrypt_range_bytes(data, offset, length).decode("latin-1")
+
+    def decrypt_range_bytes(self, message, offset, length):
+        """ Same as decrypt_range(), without converting to and from strings.
+        Args:
+            message (bytes-like): The full encrypted message.
+            offset (int): The offset in the plaintext to start decrypting at.
+            length (int): The number of bytes to decrypt.
+        Returns:
+            (bytes-like) The decrypted part of the message. """
+        if self.mode != self.CTR:
+            raise ValueError("Random access decryption requires CTR mode.")
+
+        if len(message) < 8:
+            raise ValueError("Message is too short to contain an IV.")
+        length = max(0, min(length, len(message) - 8 - offset))
+
+        view = memoryview(message)
+        plain = self.__crypt(view[8 + offset:8 + offset + length],
+                             self.schedules[0], view[:8], offset)
+        view.release()
+        return plain
+
+    def __crypt(self, data, schedules, iv=None, position=0):
+        """ Runs ECB, CTR, or CBC decryption over some data, splitting it
+        across worker processes if it is large enough.
+        Args:
+            data (bytes-like): The data to process.
+            schedules (tuple): The TripleDES subkey schedules to use.
+            iv (bytes-like): The IV, for CBC and CTR mode.
+            position (int): The offset of the data in the message, for CTR
+                            mode.
+        Returns:
+            (bytes-like) The processed data. """
+        if self.workers > 1 and len(data) >= self.parallel_threshold:
+            return _parallelCrypt(data, self.workers, self.mode,
+                                  _triple_crypt_block, schedules, iv, position)
+
+        if self.mode == self.ECB:
+            return _processBlocks(data, _triple_crypt_block, schedules)
+        if self.mode == self.CTR:
+            return _ctrCrypt(data, _triple_crypt_block, schedules, iv, position)
+        return _cbcDecrypt(data, _triple_crypt_block, schedules, iv)
 
     def gen_key(self):
         """ Generates three 64-bit random key for this cryptosystem.
@@ -52,6 +166,7 @@ class TripleDES(Symmetric):
         self.key1 = key1
         self.key2 = key2
         self.key3 = key3
+        self.schedules = _triple_schedules(self.key1, self.key2, self.key3)
 
         key1 = bitarray(self.key1)
         key2 = bitarray(self.key2)
@@ -72,6 +187,7 @@ class TripleDES(Symmetric):
         self.key1 = newKey[:self.keysize]
         self.key2 = newKey[self.keysize:self.keysize * 2]
         self.key3 = newKey[self.keysize * 2:]
+        self.schedules = _triple_schedules(self.key1, self.key2, self.key3)
 
     def get_key(self):
         """ Get the current gen_key
@@ -81,6 +197,14 @@ class TripleDES(Symmetric):
             List[string,string,string]: Current keys. """
         return self.key1, self.key2, self.key3
 
+    def fork_session(self):
+        """ Creates a copy of this cipher for a new session. The keys are
+        strings and the subkey schedules are tuples, and both are replaced
+        rather than changed when the key is set, so they are shared.
+        Returns:
+            (TripleDES) The copy. """
+        return copy.copy(self)
+
     @classmethod
     def get_name(cls):
         """ Returns the unique name for this cryptosystem """
@@ -92,330 +216,643 @@ class TripleDES(Symmetric):
         return 2
   
 
-def DES(plaintext,key,mode):
-    #calls the Initial Permutation
-    IP = Inperm(plaintext)
-    
-    #Splits the plaintext into halves
-    L0 = IP[32:]
-    R0 = IP[:32]
-    
-    #Generates K1 and K2 from the key
-    PKeys = PermKeys(key)
-    
-    #Rounds
-    for i in range(16):
-        L1 = R0
-        R1 = L0.copy()
-        if mode == 0:
-            R1 ^= F(R0,PKeys[i])
-        else:
-            R1 ^= F(R0,PKeys[::-1][i])
-        R0 = R1
-        L0 = L1
-        
-    
-    #Returns the inverted IP of the two halves
-    return InvIP(L1,R1)
-    
-
-def PermKeys(key):
-    bitArrayKey = bitarray(key)
-    
-    #P56: Permutation of from 64 bit to 56 bit
-    bin_map = [56,48,40,32,24,16,8,0,57,49,41,33,25,17,9,1,58,50,42,34,26,18,10,2,59,51,43,35,62,54,46,38,30,22,14,6,61,53,45,37,29,21,13,5,60,52,44,36,28,20,12,4,27,19,11,3]
-    x = bitArrayKey.to01()
-    P56 = bitarray(''.join(x[i] for i in bin_map))    
-    
-    #split into halves and shift
-    L = P56[28:]
-    R = P56[:28]
-    Rol(L,1)
-    Rol(R,1)
-    
-    #Creating K1
-    K1 = FourtyEightPerm(L,R)
-    
-    #shifting again
-    Rol(L,1)
-    Rol(R,1)
-    
-    #creating K2
-    K2 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K3
-    K3 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K4
-    K4 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K5
-    K5 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K6
-    K6 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K7
-    K7 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K8
-    K8 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,1)
-    Rol(R,1)
-    
-    #creating K9
-    K9 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K10
-    K10 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K11
-    K11 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K12
-    K12 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K13
-    K13 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K14
-    K14 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,2)
-    Rol(R,2)
-    
-    #creating K15
-    K15 = FourtyEightPerm(L,R)
-
-    #shifting again
-    Rol(L,1)
-    Rol(R,1)
-    
-    #creating K16
-    K16 = FourtyEightPerm(L,R)
+#Initial Permutation (1-based bit positions, MSB first)
+_IP = [58,50,42,34,26,18,10,2,60,52,44,36,28,20,12,4,62,54,46,38,30,22,14,6,64,56,48,40,32,24,16,8,57,49,41,33,25,17,9,1,59,51,43,35,27,19,11,3,61,53,45,37,29,21,13,5,63,55,47,39,31,23,15,7]
 
+#Inverse Initial Permutation
+_FP = [40,8,48,16,56,24,64,32,39,7,47,15,55,23,63,31,38,6,46,14,54,22,62,30,37,5,45,13,53,21,61,29,36,4,44,12,52,20,60,28,35,3,43,11,51,19,59,27,34,2,42,10,50,18,58,26,33,1,41,9,49,17,57,25]
+
+#Expansion/Permutation of 4 bit
+_E = [32,1,2,3,4,5,4,5,6,7,8,9,8,9,10,11,12,13,12,13,14,15,16,17,16,17,18,19,20,21,20,21,22,23,24,25,24,25,26,27,28,29,28,29,30,31,32,1]
+
+#Last Permutation in F function
+_P = [16,7,20,21,29,12,28,17,1,15,23,26,5,18,31,10,2,8,24,14,32,27,3,9,19,13,30,6,22,11,4,25]
+
+#P56: Permutation of from 64 bit to 56 bit
+_PC1 = [57,49,41,33,25,17,9,1,58,50,42,34,26,18,10,2,59,51,43,35,27,19,11,3,60,52,44,36,63,55,47,39,31,23,15,7,62,54,46,38,30,22,14,6,61,53,45,37,29,21,13,5,28,20,12,4]
+
+#P48: 48 Permutation of 56-bit (kept as in the original implementation, which
+#differs from the textbook table in one position)
+_PC2 = [14,17,11,24,1,5,3,28,15,6,21,10,23,19,12,4,26,8,16,7,27,20,13,2,41,52,31,37,47,55,30,40,51,45,33,48,44,49,39,56,34,54,46,42,50,36,29,32]
+
+#Number of left rotations of the key halves before each round
+_SHIFTS = [1,1,2,2,2,2,2,2,1,2,2,2,2,2,2,1]
+
+#The SBoxes
+_SBOXES = [
+    [[14,4,13,1,2,15,11,8,3,10,6,12,5,9,0,7],[0,15,7,4,14,2,13,1,10,6,12,11,9,5,3,8],[4,1,14,8,13,6,2,11,15,12,9,7,3,10,5,0],[15,12,8,2,4,9,1,7,5,11,3,14,10,0,6,13]],
+    [[15,1,8,14,6,11,3,4,9,7,2,13,12,0,5,10],[3,13,4,7,15,2,8,14,12,0,1,10,6,9,11,5],[0,14,7,11,10,4,13,1,5,8,12,6,9,3,2,15],[13,8,10,1,3,15,4,2,11,6,7,12,0,5,14,9]],
+    [[10,0,9,14,6,3,15,5,1,13,12,7,11,4,2,8],[13,7,0,9,3,4,6,10,2,8,5,14,12,11,15,1],[13,6,4,9,8,15,3,0,11,1,2,12,5,10,14,7],[1,10,13,0,6,9,8,7,4,15,14,3,11,5,2,12]],
+    [[7,13,14,3,0,6,9,10,1,2,8,5,11,12,4,15],[13,8,11,5,6,15,0,3,4,7,2,12,1,10,14,9],[10,6,9,0,12,11,7,13,15,1,3,14,5,2,8,4],[3,15,0,6,10,1,13,8,9,4,5,11,12,7,2,14]],
+    [[2,12,4,1,7,10,11,6,8,5,3,15,13,0,14,9],[14,11,2,12,4,7,13,1,5,0,15,10,3,9,8,6],[4,2,1,11,10,13,7,8,15,9,12,5,6,3,0,14],[11,8,12,7,1,14,2,13,6,15,0,9,10,4,5,3]],
+    [[12,1,10,15,9,2,6,8,0,13,3,4,14,7,5,11],[10,15,4,2,7,12,9,5,6,1,13,14,0,11,3,8],[9,14,15,5,2,8,12,3,7,0,4,10,1,13,11,6],[4,3,2,12,9,5,15,10,11,14,1,7,6,0,8,13]],
+    [[4,11,2,14,15,0,8,13,3,12,9,7,5,10,6,1],[13,0,11,7,4,9,1,10,14,3,5,12,2,15,8,6],[1,4,11,13,12,3,7,14,10,15,6,8,0,5,9,2],[6,11,13,8,1,4,10,7,9,5,0,15,14,2,3,12]],
+    [[13,2,8,4,6,15,11,1,10,9,3,14,5,0,12,7],[1,15,13,8,10,3,7,4,12,5,6,11,0,14,9,2],[7,11,4,1,9,12,14,2,0,6,10,13,15,3,5,8],[2,1,14,7,4,10,8,13,15,12,9,0,3,5,6,11]]]
+
+
+def _permute(value, table, width):
+    """ Applies a bit permutation to an integer. This is slow, so it is only
+    used to build the lookup tables and the key schedule.
+    Args:
+        value (int): The input, as a width-bit integer.
+        table (list[int]): 1-based input bit position for each output bit.
+        width (int): The number of bits in the input.
+    Returns:
+        (int) The permuted value. """
+    out = 0
+    for pos in table:
+        out = (out << 1) | ((value >> (width - pos)) & 1)
+    return out
+
+def _byte_tables(table):
+    """ Builds byte-indexed lookup tables for a 64-bit permutation, so that the
+    permutation can be done with eight lookups.
+    Args:
+        table (list[int]): The permutation.
+    Returns:
+        (list[list[int]]) For each input byte position, the permuted output
+        for every possible value of that byte. """
+    tables = []
+    for byte_pos in range(8):
+        #the permutation is linear, so build each entry from its lowest set bit
+        bits = [_permute(1 << (56 - 8*byte_pos + i), table, 64) for i in range(8)]
+        entries = [0] * 256
+        for value in range(1, 256):
+            low = value & -value
+            entries[value] = entries[value ^ low] | bits[low.bit_length() - 1]
+        tables.append(entries)
+    return tables
+
+def _sp_tables():
+    """ Builds the combined SP-box tables, which merge each SBox with the
+    permutation at the end of the F function.
+    Returns:
+        (list[list[int]]) For each SBox, the permuted 32-bit output for every
+        6-bit input. """
+    tables = []
+    for box in range(8):
+        entries = []
+        for value in range(64):
+            row = ((value >> 4) & 2) | (value & 1)
+            col = (value >> 1) & 0xf
+            entries.append(_permute(_SBOXES[box][row][col] << (28 - 4*box), _P, 32))
+        tables.append(entries)
+    return tables
+
+def _sbox_circuit(box):
+    """ Builds a bitsliced version of an SBox, as straight-line Python code.
+    Each output bit is a tree of multiplexers over the six input bits, and
+    identical subtrees are shared between the four outputs.
+    Args:
+        box (int): The SBox to build.
+    Returns:
+        (function) A function taking the six input bit planes (most
+        significant first) and a plane of all ones, and returning the four
+        output bit planes. """
+    lines = ["def sbox(x0, x1, x2, x3, x4, x5, m):"]
+    nodes = {}
+
+    def build(table, var):
+        if not any(table):
+            return "0"
+        if all(table):
+            return "m"
+        half = len(table) // 2
+        lo = build(table[:half], var + 1)
+        hi = build(table[half:], var + 1)
+        if lo == hi:
+            return lo
+
+        sel = "x%d" % (var)
+        if lo == "0" and hi == "m":
+            return sel
+        if (sel, lo, hi) not in nodes:
+            if lo == "m" and hi == "0":
+                expr = "%s ^ m" % (sel)
+            elif lo == "0":
+                expr = "%s & %s" % (hi, sel)
+            elif hi == "0":
+                expr = "%s & (%s ^ m)" % (lo, sel)
+            elif hi == "m":
+                expr = "%s | %s" % (lo, sel)
+            elif lo == "m":
+                expr = "%s | (%s ^ m)" % (hi, sel)
+            else:
+                expr = "%s ^ ((%s ^ %s) & %s)" % (lo, lo, hi, sel)
+            nodes[(sel, lo, hi)] = "t%d" % (len(nodes))
+            lines.append("    %s = %s" % (nodes[(sel, lo, hi)], expr))
+        return nodes[(sel, lo, hi)]
+
+    outputs = []
+    for bit in range(4):
+        table = []
+        for value in range(64):
+            row = ((value >> 4) & 2) | (value & 1)
+            col = (value >> 1) & 0xf
+            table.append((_SBOXES[box][row][col] >> (3 - bit)) & 1)
+        outputs.append(build(table, 0))
+    lines.append("    return %s" % (", ".join(outputs)))
+
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["sbox"]
+
+_IP_TABLES = _byte_tables(_IP)
+_FP_TABLES = _byte_tables(_FP)
+_SP_TABLES = _sp_tables()
+_SBOX_CIRCUITS = [_sbox_circuit(box) for box in range(8)]
+
+
+def _crypt_block(block, subkeys):
+    """ Runs DES over a single block.
+    Args:
+        block (int): The 64-bit block.
+        subkeys (tuple): The round subkeys, as returned by PermKeys(), in the
+                         order they should be applied.
+    Returns:
+        (int) The 64-bit output block. """
+    ip0, ip1, ip2, ip3, ip4, ip5, ip6, ip7 = _IP_TABLES
+    sp0, sp1, sp2, sp3, sp4, sp5, sp6, sp7 = _SP_TABLES
+
+    #Initial Permutation
+    ip = (ip0[block >> 56] | ip1[(block >> 48) & 0xff] |
+          ip2[(block >> 40) & 0xff] | ip3[(block >> 32) & 0xff] |
+          ip4[(block >> 24) & 0xff] | ip5[(block >> 16) & 0xff] |
+          ip6[(block >> 8) & 0xff] | ip7[block & 0xff])
+
+    #Splits the block into halves
+    left = ip & 0xffffffff
+    right = ip >> 32
 
-    
-    return (K1,K2,K3,K4,K5,K6,K7,K8,K9,K10,K11,K12,K13,K14,K15,K16)
-
-
-def F(text,key):
-    #creates the SBoxes
-    S1 = [[14,4,13,1,2,15,11,8,3,10,6,12,5,9,0,7],[0,15,7,4,14,2,13,1,10,6,12,11,9,5,3,8],[4,1,14,8,13,6,2,11,15,12,9,7,3,10,5,0],[15,12,8,2,4,9,1,7,5,11,3,14,10,0,6,13]]
-    S2 = [[15,1,8,14,6,11,3,4,9,7,2,13,12,0,5,10],[3,13,4,7,15,2,8,14,12,0,1,10,6,9,11,5],[0,14,7,11,10,4,13,1,5,8,12,6,9,3,2,15],[13,8,10,1,3,15,4,2,11,6,7,12,0,5,14,9]]
-    S3 = [[10,0,9,14,6,3,15,5,1,13,12,7,11,4,2,8],[13,7,0,9,3,4,6,10,2,8,5,14,12,11,15,1],[13,6,4,9,8,15,3,0,11,1,2,12,5,10,14,7],[1,10,13,0,6,9,8,7,4,15,14,3,11,5,2,12]]
-    S4 = [[7,13,14,3,0,6,9,10,1,2,8,5,11,12,4,15],[13,8,11,5,6,15,0,3,4,7,2,12,1,10,14,9],[10,6,9,0,12,11,7,13,15,1,3,14,5,2,8,4],[3,15,0,6,10,1,13,8,9,4,5,11,12,7,2,14]]
-    S5 = [[2,12,4,1,7,10,11,6,8,5,3,15,13,0,14,9],[14,11,2,12,4,7,13,1,5,0,15,10,3,9,8,6],[4,2,1,11,10,13,7,8,15,9,12,5,6,3,0,14],[11,8,12,7,1,14,2,13,6,15,0,9,10,4,5,3]]
-    S6 = [[12,1,10,15,9,2,6,8,0,13,3,4,14,7,5,11],[10,15,4,2,7,12,9,5,6,1,13,14,0,11,3,8],[9,14,15,5,2,8,12,3,7,0,4,10,1,13,11,6],[4,3,2,12,9,5,15,10,11,14,1,7,6,0,8,13]]
-    S7 = [[4,11,2,14,15,0,8,13,3,12,9,7,5,10,6,1],[13,0,11,7,4,9,1,10,14,3,5,12,2,15,8,6],[1,4,11,13,12,3,7,14,10,15,6,8,0,5,9,2],[6,11,13,8,1,4,10,7,9,5,0,15,14,2,3,12]]
-    S8 = [[13,2,8,4,6,15,11,1,10,9,3,14,5,0,12,7],[1,15,13,8,10,3,7,4,12,5,6,11,0,14,9,2],[7,11,4,1,9,12,14,2,0,6,10,13,15,3,5,8],[2,1,14,7,4,10,8,13,15,12,9,0,3,5,6,11]]
-    
-    #Expansion/Permutation of 4 bit
-    bin_map = [32,1,2,3,4,5,4,5,6,7,8,9,8,9,10,11,12,13,12,13,14,15,16,17,16,17,18,19,20,21,20,21,22,23,24,25,24,25,26,27,28,29,28,29,30,31,32,1]
-    bin32 = text.to01()
-    B48 = bitarray(''.join(bin32[i-1] for i in bin_map))
-    
-    #Xor with the key
-    B48 ^= key
-    
-    #Splits into 8 6-bits 
-    Box1 = B48[0:6]
-    Box2 = B48[6:12]
-    Box3 = B48[12:18]
-    Box4 = B48[18:24]
-    Box5 = B48[24:30]
-    Box6 = B48[30:36]
-    Box7 = B48[36:42]
-    Box8 = B48[42:48]
-    
-    outer = [0,5]
-    inner = [1,2,3,4]
-    
-    #Box1 through S1
-    TmpBox1 = Box1.to01()
-    Box1col = int(''.join(TmpBox1[i] for i in inner),2)    
-    Box1row = int(''.join(TmpBox1[i] for i in outer),2)
-    Box1Ans = bitarray(fillBinString(bin(S1[Box1row][Box1col])[2:], 4))
-    
-    #Box2 through S2
-    TmpBox2 = Box2.to01()
-    Box2col = int(''.join(TmpBox2[i] for i in inner),2)    
-    Box2row = int(''.join(TmpBox2[i] for i in outer),2)
-    Box2Ans = bitarray(fillBinString(bin(S2[Box2row][Box2col])[2:], 4))
-
-    #Box3 through S3
-    TmpBox3 = Box3.to01()
-    Box3col = int(''.join(TmpBox3[i] for i in inner),2)    
-    Box3row = int(''.join(TmpBox3[i] for i in outer),2)
-    Box3Ans = bitarray(fillBinString(bin(S3[Box3row][Box3col])[2:], 4))
-
-    #Box4 through S4
-    TmpBox4 = Box4.to01()
-    Box4col = int(''.join(TmpBox4[i] for i in inner),2)    
-    Box4row = int(''.join(TmpBox4[i] for i in outer),2)
-    Box4Ans = bitarray(fillBinString(bin(S4[Box4row][Box4col])[2:], 4))
-
-    #Box5 through S5
-    TmpBox5 = Box5.to01()
-    Box5col = int(''.join(TmpBox5[i] for i in inner),2)    
-    Box5row = int(''.join(TmpBox5[i] for i in outer),2)
-    Box5Ans = bitarray(fillBinString(bin(S5[Box5row][Box5col])[2:], 4))
-
-    #Box6 through S6
-    TmpBox6 = Box6.to01()
-    Box6col = int(''.join(TmpBox6[i] for i in inner),2)    
-    Box6row = int(''.join(TmpBox6[i] for i in outer),2)
-    Box6Ans = bitarray(fillBinString(bin(S6[Box6row][Box6col])[2:], 4))
-
-    #Box7 through S7
-    TmpBox7 = Box7.to01()
-    Box7col = int(''.join(TmpBox7[i] for i in inner),2)    
-    Box7row = int(''.join(TmpBox7[i] for i in outer),2)
-    Box7Ans = bitarray(fillBinString(bin(S7[Box7row][Box7col])[2:], 4))
-
-    #Box8 through S8
-    TmpBox8 = Box8.to01()
-    Box8col = int(''.join(TmpBox8[i] for i in inner),2)    
-    Box8row = int(''.join(TmpBox8[i] for i in outer),2)
-    Box8Ans = bitarray(fillBinString(bin(S8[Box8row][Box8col])[2:], 4))
-    
-    #combine the s boxes results
-    combine = bitarray(Box1Ans.to01()+Box2Ans.to01()+Box3Ans.to01()+Box4Ans.to01()+Box5Ans.to01()+Box6Ans.to01()+Box7Ans.to01()+Box8Ans.to01())
-    
-    #Last Permutation in F function
-    bmap = [16,7,20,21,29,12,28,17,1,15,23,26,5,18,31,10,2,8,24,14,32,27,3,9,19,13,30,6,22,11,4,25]
-    b32 = combine.to01()
-    return bitarray(''.join(b32[i-1] for i in bmap))    
-
-#Initial Permutation Function
-#replaces the bits to the mapping (2,6,3,1,4,8,5,7)
-def Inperm(ptext):
-    bin_map = [58,50,42,34,26,18,10,2,60,52,44,36,28,20,12,4,62,54,46,38,30,22,14,6,64,56,48,40,32,24,16,8,57,49,41,33,25,17,9,1,59,51,43,35,27,19,11,3,61,53,45,37,29,21,13,5,63,55,47,39,31,23,15,7]
-    
-    x = ptext.to01()
-    return bitarray(''.join(x[i-1] for i in bin_map))
+    #Rounds
+    for k0, k1, k2, k3, k4, k5, k6, k7 in subkeys:
+        #Expansion of the right half, with the end bits wrapped around
+        ext = ((right & 1) << 33) | (right << 1) | (right >> 31)
+        left ^= (sp0[((ext >> 28) & 0x3f) ^ k0] | sp1[((ext >> 24) & 0x3f) ^ k1] |
+                 sp2[((ext >> 20) & 0x3f) ^ k2] | sp3[((ext >> 16) & 0x3f) ^ k3] |
+                 sp4[((ext >> 12) & 0x3f) ^ k4] | sp5[((ext >> 8) & 0x3f) ^ k5] |
+                 sp6[((ext >> 4) & 0x3f) ^ k6] | sp7[(ext & 0x3f) ^ k7])
+        left, right = right, left
+
+    #Inverse Initial Permutation of the two halves
+    out = (left << 32) | right
+    fp0, fp1, fp2, fp3, fp4, fp5, fp6, fp7 = _FP_TABLES
+    return (fp0[out >> 56] | fp1[(out >> 48) & 0xff] |
+            fp2[(out >> 40) & 0xff] | fp3[(out >> 32) & 0xff] |
+            fp4[(out >> 24) & 0xff] | fp5[(out >> 16) & 0xff] |
+            fp6[(out >> 8) & 0xff] | fp7[out & 0xff])
+
+def _triple_crypt_block(block, schedules):
+    """ Runs TripleDES (EDE) over a single block.
+    Args:
+        block (int): The 64-bit block.
+        schedules (tuple): The three subkey schedules, in the order they are
+                           applied, as returned by _triple_schedules().
+    Returns:
+        (int) The 64-bit output block. """
+    subkeys1, subkeys2, subkeys3 = schedules
+    return _crypt_block(_crypt_block(_crypt_block(block, subkeys1), subkeys2),
+                        subkeys3)
+
+@functools.lru_cache(maxsize=16)
+def _cached_schedules(key):
+    """ Computes and caches the forward and reverse subkey schedules for a key.
+    Args:
+        key (string): The 64-bit key, as a string of 0s and 1s.
+    Returns:
+        (tuple) The encryption and decryption schedules. """
+    PKeys = PermKeys(key)
+    return PKeys, PKeys[::-1]
+
+def _schedules(key):
+    """ Gets the forward and reverse subkey schedules for a key.
+    Args:
+        key (bitarray or string): The 64-bit key.
+    Returns:
+        (tuple) The encryption and decryption schedules. """
+    if not isinstance(key, str):
+        key = bitarray(key).to01()
+    return _cached_schedules(key)
+
+def _triple_schedules(key1, key2, key3):
+    """ Gets the TripleDES subkey schedules for a set of keys.
+    Args:
+        key1, key2, key3 (bitarray or string): The three 64-bit keys.
+    Returns:
+        (tuple) The schedules for encryption and for decryption, each suitable
+        for passing to _triple_crypt_block(). """
+    enc1, dec1 = _schedules(key1)
+    enc2, dec2 = _schedules(key2)
+    enc3, dec3 = _schedules(key3)
+    return (enc1, dec2, enc3), (dec3, enc2, dec1)
+
+def _to_int(bits):
+    """ Converts a bitarray (or string of 0s and 1s) to an int. """
+    return int(bitarray(bits).to01(), 2)
+
+def _from_int(value):
+    """ Converts a 64-bit int to a bitarray. """
+    block = bitarray()
+    block.frombytes(value.to_bytes(8, "big"))
+    return block
 
-#Inverse Initial Permutation
-def InvIP(L,R):
-    B8 = bitarray(L.to01()+R.to01()).to01()
-    
-    bin_map = [40,8,48,16,56,24,64,32,39,7,47,15,55,23,63,31,38,6,46,14,54,22,62,30,37,5,45,13,53,21,61,29,36,4,44,12,52,20,60,28,35,3,43,11,51,19,59,27,34,2,42,10,50,18,58,26,33,1,41,9,49,17,57,25]
-    
-    return bitarray(''.join(B8[i-1] for i in bin_map))    
 
-#P48: 48 Permutation of 56-bit
-def FourtyEightPerm(L,R):
-    B56 = L.to01()+R.to01()
-    
-    bin_map = [13,16,10,23,0,4,2,27,14,5,20,9,22,18,11,3,25,7,15,6,26,19,12,1,40,51,30,36,46,54,29,39,50,44,32,47,43,48,38,55,33,53,45,41,49,35,28,31]
-    return bitarray(''.join(B56[i] for i in bin_map))
+def DES(plaintext,key,mode):
+    """ Encrypts or decrypts a single 64-bit block.
+    Args:
+        plaintext (bitarray): The block.
+        key (bitarray or string): The 64-bit key.
+        mode (int): 0 to encrypt, 1 to decrypt.
+    Returns:
+        (bitarray) The output block. """
+    PKeys = _schedules(key)[mode]
+    return _from_int(_crypt_block(_to_int(plaintext), PKeys))
 
-def Rol(bitArr, num):
-    for i in range(num):
-        bitArr.insert(len(bitArr), bitArr.pop(0))
 
-def fillBinString(string, num):
-    answerString = string
-    while (len(answerString) < num):
-        answerString = "0" + answerString
-    return answerString
+def PermKeys(key):
+    """ Generates the round subkeys from a key.
+    Args:
+        key (bitarray or string): The 64-bit key.
+    Returns:
+        (tuple) The 16 subkeys, each split into the eight 6-bit chunks that
+        feed the SBoxes. """
+    #P56: Permutation of from 64 bit to 56 bit, then split into halves
+    P56 = _permute(_to_int(key), _PC1, 64)
+    C = P56 >> 28
+    D = P56 & 0xfffffff
+
+    PKeys = []
+    for shift in _SHIFTS:
+        C = ((C << shift) | (C >> (28 - shift))) & 0xfffffff
+        D = ((D << shift) | (D >> (28 - shift))) & 0xfffffff
+
+        #P48 takes the halves in swapped order
+        K = _permute((D << 28) | C, _PC2, 56)
+        PKeys.append(tuple((K >> (42 - 6*i)) & 0x3f for i in range(8)))
+
+    return tuple(PKeys)
+
+#Number of blocks above which the bitsliced engine beats the table-driven one
+_BITSLICE_THRESHOLD = 128
+#Largest number of blocks to bitslice at once, which bounds the plane size
+_BITSLICE_BATCH = 16384
+
+def _toPlanes(data, lanes):
+    """ Transposes blocks into bit planes. The blocks are split into eight
+    groups of lanes blocks each, and block k of group g ends up in bit
+    8*k + g of every plane.
+    Args:
+        data (bytes-like): The blocks, 64 * lanes bytes in total.
+        lanes (int): The number of blocks in each group.
+    Returns:
+        (list[int]) The 64 bit planes, most significant block bit first. """
+    low = int.from_bytes(b"\x01" * lanes, "little")
+    planes = [0] * 64
+    for group in range(8):
+        base = group * lanes * 8
+        for byte in range(8):
+            column = int.from_bytes(data[base + byte:base + lanes * 8:8], "little")
+            for bit in range(8):
+                planes[byte * 8 + bit] |= ((column >> (7 - bit)) & low) << group
+    return planes
+
+def _fromPlanes(planes, lanes, output):
+    """ The inverse of _toPlanes().
+    Args:
+        planes (list[int]): The 64 bit planes.
+        lanes (int): The number of blocks in each group.
+        output (bytearray): Where to write the 64 * lanes bytes of blocks. """
+    low = int.from_bytes(b"\x01" * lanes, "little")
+    for group in range(8):
+        base = group * lanes * 8
+        for byte in range(8):
+            column = 0
+            for bit in range(8):
+                column |= ((planes[byte * 8 + bit] >> group) & low) << (7 - bit)
+            output[base + byte:base + lanes * 8:8] = column.to_bytes(lanes, "little")
+
+def _bitslicedCrypt(planes, schedules, mask):
+    """ Runs DES over every lane of a set of bit planes at once.
+    Args:
+        planes (list[int]): The 64 input bit planes.
+        schedules (tuple): The subkey schedules to apply, in order. Passing
+                           more than one chains DES, as TripleDES does.
+        mask (int): A plane with every lane set.
+    Returns:
+        (list[int]) The 64 output bit planes. """
+    sboxes = _SBOX_CIRCUITS
+    for subkeys in schedules:
+        #Initial Permutation and split into halves
+        ip = [planes[i - 1] for i in _IP]
+        right = ip[:32]
+        left = ip[32:]
+
+        for roundKey in subkeys:
+            #Expansion, then xor with the key, which is the same in every lane
+            ext = [right[i - 1] for i in _E]
+            sout = []
+            for box in range(8):
+                chunk = roundKey[box]
+                x = ext[6 * box:6 * box + 6]
+                for bit in range(6):
+                    if (chunk >> (5 - bit)) & 1:
+                        x[bit] ^= mask
+                sout.extend(sboxes[box](x[0], x[1], x[2], x[3], x[4], x[5], mask))
+
+            newRight = [left[i] ^ sout[pos - 1] for i, pos in enumerate(_P)]
+            left = right
+            right = newRight
+
+        #Inverse Initial Permutation of the two halves
+        out = left + right
+        planes = [out[i - 1] for i in _FP]
+    return planes
+
+def _bitslicedBlocks(data, schedules):
+    """ Runs DES over many blocks using the bitsliced engine.
+    Args:
+        data (bytes-like): The blocks. Must be a multiple of 8 bytes.
+        schedules (tuple): The subkey schedules to apply, in order.
+    Returns:
+        (bytearray) The output blocks. """
+    length = len(data)
+    #Pad up to a whole number of lanes in each of the eight groups
+    lanes = -(-length // 64)
+    padded = bytearray(data)
+    padded += bytes(lanes * 64 - length)
+
+    mask = (1 << (lanes * 8)) - 1
+    planes = _bitslicedCrypt(_toPlanes(padded, lanes), schedules, mask)
+    _fromPlanes(planes, lanes, padded)
+
+    del padded[length:]
+    return padded
+
+def _sliceSchedules(crypt, schedule):
+    """ Converts the schedule(s) for a block function to the form taken by
+    _bitslicedBlocks().
+    Args:
+        crypt (function): The block function.
+        schedule: The subkey schedule(s) for the block function.
+    Returns:
+        (tuple) The subkey schedules, in order. """
+    if crypt is _crypt_block:
+        return (schedule,)
+    return schedule
+
+def batchDES(blocks, key, mode):
+    """ Encrypts or decrypts many blocks independently under one key. Large
+    batches run through the bitsliced engine, where each round is computed
+    once for every block.
+    Args:
+        blocks (bytes-like): The blocks, a multiple of 8 bytes long.
+        key (bitarray or string): The 64-bit key.
+        mode (int): 0 to encrypt, 1 to decrypt.
+    Returns:
+        (bytearray) The output blocks. """
+    return _processBlocks(blocks, _crypt_block, _schedules(key)[mode])
+
+def batchTripleDES(blocks, key1, key2, key3, mode):
+    """ The TripleDES version of batchDES().
+    Args:
+        blocks (bytes-like): The blocks, a multiple of 8 bytes long.
+        key1, key2, key3 (bitarray or string): The three 64-bit keys.
+        mode (int): 0 to encrypt, 1 to decrypt.
+    Returns:
+        (bytearray) The output blocks. """
+    schedules = _triple_schedules(key1, key2, key3)[mode]
+    return _processBlocks(blocks, _triple_crypt_block, schedules)
+
+def _processBlocks(data, crypt, schedule):
+    """ Runs a block function over every 64-bit block of some data. The input
+    is walked in place and the output is written into a single preallocated
+    buffer, so this is linear in the length of the data.
+    Args:
+        data (bytes-like): The input. Trailing partial blocks are dropped.
+        crypt (function): The block function, either _crypt_block or
+                          _triple_crypt_block.
+        schedule: The subkey schedule(s) to pass to the block function.
+    Returns:
+        (bytearray) The processed data. """
+    view = memoryview(data)
+    length = len(view) - len(view) % 8
+    if length // 8 >= _BITSLICE_THRESHOLD:
+        schedules = _sliceSchedules(crypt, schedule)
+        output = bytearray(length)
+        for start in range(0, length, 8 * _BITSLICE_BATCH):
+            end = min(start + 8 * _BITSLICE_BATCH, length)
+            output[start:end] = _bitslicedBlocks(view[start:end], schedules)
+        view.release()
+        return output
+
+    output = bytearray(length)
+    pack_into = struct.pack_into
+    offset = 0
+    for block, in struct.iter_unpack(">Q", view[:length]):
+        pack_into(">Q", output, offset, crypt(block, schedule))
+        offset += 8
+
+    view.release()
+    return output
+
+def _chainBlocks(ptext, crypt, schedule):
+    """ Runs a block function over a message.
+    Args:
+        ptext (bitarray or bytes-like): The message. Trailing partial blocks
+                                        are dropped.
+        crypt (function): The block function.
+        schedule: The subkey schedule(s) to pass to the block function.
+    Returns:
+        (bitarray or bytearray) The processed message, as the same kind of
+        object that was passed in. """
+    if not isinstance(ptext, bitarray):
+        return _processBlocks(ptext, crypt, schedule)
+
+    #bitarray exposes its buffer, so this does not copy the message
+    view = memoryview(ptext)
+    output = _processBlocks(view[:len(ptext) // 64 * 8], crypt, schedule)
+    view.release()
 
-def blockChainDES(ptext,key,mode):
-    tmp = True
-    maxlen = len(ptext.to01())
-    low = 0
-    high = 64  
     cipher = bitarray()
-    ciphertext = ""
-    while (tmp):
-        if high > maxlen:
-            break
-        
-        plaintext = bitarray(ptext.to01()[low:high])
-        if mode == 0: 
-            encrypt = DES(plaintext,key,0)
+    cipher.frombytes(output)
+    return cipher
+
+def _pad(data):
+    """ Adds PKCS#7 padding to some data.
+    Args:
+        data (bytes-like): The data to pad.
+    Returns:
+        (bytearray) The data, padded to a multiple of 8 bytes. """
+    padLength = 8 - len(data) % 8
+    padded = bytearray(data)
+    padded += bytes([padLength]) * padLength
+    return padded
+
+def _unpad(data):
+    """ Removes PKCS#7 padding from some data.
+    Args:
+        data (bytearray): The padded data.
+    Returns:
+        (bytearray) The data, without the padding. """
+    if not data or len(data) % 8 != 0:
+        raise ValueError("Padded data must be a non-empty multiple of 8 bytes.")
+    padLength = data[-1]
+    if not 1 <= padLength <= 8 or \
+            data[-padLength:] != bytes([padLength]) * padLength:
+        raise ValueError("Invalid padding.")
+    del data[-padLength:]
+    return data
+
+def _cbcEncrypt(data, crypt, schedule, iv):
+    """ Encrypts data in CBC mode.
+    Args:
+        data (bytes-like): The data, a multiple of 8 bytes long.
+        crypt (function): The block function.
+        schedule: The encryption subkey schedule(s) for the block function.
+        iv (bytes-like): The 8-byte IV.
+    Returns:
+        (bytearray) The encrypted data, without the IV. """
+    output = bytearray(len(data))
+    pack_into = struct.pack_into
+    previous = int.from_bytes(iv, "big")
+    offset = 0
+    for block, in struct.iter_unpack(">Q", data):
+        previous = crypt(block ^ previous, schedule)
+        pack_into(">Q", output, offset, previous)
+        offset += 8
+    return output
+
+def _cbcDecrypt(data, crypt, schedule, iv):
+    """ Decrypts data in CBC mode.
+    Args:
+        data (bytes-like): The encrypted data, without the IV.
+        crypt (function): The block function.
+        schedule: The decryption subkey schedule(s) for the block function.
+        iv (bytes-like): The 8-byte IV.
+    Returns:
+        (bytearray) The decrypted data. """
+    length = len(data)
+    if length % 8 != 0:
+        raise ValueError("CBC ciphertext must be a multiple of 8 bytes.")
+    if length == 0:
+        return bytearray()
+
+    #Every block can be decrypted independently, and then xored with the
+    #ciphertext block before it
+    decrypted = _processBlocks(data, crypt, schedule)
+    previous = int.from_bytes(iv, "big") << (8 * (length - 8)) | \
+               int.from_bytes(data, "big") >> 64
+    output = int.from_bytes(decrypted, "big") ^ previous
+    return bytearray(output.to_bytes(length, "big"))
+
+def _ctrKeystream(crypt, schedule, iv, first, count):
+    """ Generates CTR mode keystream blocks. Block i of the keystream is the
+    encryption of the IV plus i, so any range can be computed independently.
+    Args:
+        crypt (function): The block function.
+        schedule: The encryption subkey schedule(s) for the block function.
+        iv (bytes-like): The 8-byte IV.
+        first (int): The index of the first block to generate.
+        count (int): The number of blocks to generate.
+    Returns:
+        (bytearray) The keystream. """
+    counters = bytearray(8 * count)
+    pack_into = struct.pack_into
+    counter = int.from_bytes(iv, "big") + first
+    for offset in range(0, 8 * count, 8):
+        pack_into(">Q", counters, offset, counter & 0xffffffffffffffff)
+        counter += 1
+    return _processBlocks(counters, crypt, schedule)
+
+def _ctrCrypt(data, crypt, schedule, iv, position):
+    """ Encrypts or decrypts data in CTR mode.
+    Args:
+        data (bytes-like): The data.
+        crypt (function): The block function.
+        schedule: The encryption subkey schedule(s) for the block function.
+        iv (bytes-like): The 8-byte IV.
+        position (int): The offset of the data within the full message.
+    Returns:
+        (bytes) The processed data. """
+    length = len(data)
+    first = position // 8
+    skip = position % 8
+    keystream = _ctrKeystream(crypt, schedule, iv, first,
+                              (skip + length + 7) // 8)
+
+    #XOR everything in one go rather than byte by byte
+    stream = int.from_bytes(memoryview(keystream)[skip:skip + length], "big")
+    return (int.from_bytes(data, "big") ^ stream).to_bytes(length, "big")
+
+#Process pools used for parallel encryption, by number of workers
+_executors = {}
+_executorsLock = threading.Lock()
+
+def _executor(workers):
+    """ Gets a shared process pool.
+    Args:
+        workers (int): The number of worker processes in the pool.
+    Returns:
+        (ProcessPoolExecutor) The pool. """
+    with _executorsLock:
+        if workers not in _executors:
+            _executors[workers] = concurrent.futures.ProcessPoolExecutor(workers)
+        return _executors[workers]
+
+def _parallelCrypt(data, workers, mode, crypt, schedule, iv=None, position=0):
+    """ Splits data into one chunk per worker and processes the chunks in
+    parallel. This works for every mode where blocks do not depend on the
+    output of the previous block: ECB, CTR, and CBC decryption.
+    Args:
+        data (bytes-like): The data. Must be a multiple of 8 bytes unless the
+                           mode is CTR.
+        workers (int): The number of worker processes to use.
+        mode (string): The block cipher mode.
+        crypt (function): The block function.
+        schedule: The subkey schedule(s) for the block function.
+        iv (bytes-like): The IV, for CBC and CTR mode.
+        position (int): The offset of the data in the message, for CTR mode.
+    Returns:
+        (bytearray) The processed data. """
+    view = memoryview(data)
+    length = len(view)
+    chunkSize = -(-length // (8 * workers)) * 8
+    executor = _executor(workers)
+
+    futures = []
+    for start in range(0, length, chunkSize):
+        chunk = bytes(view[start:start + chunkSize])
+        if mode == TripleDES.ECB:
+            futures.append(executor.submit(_processBlocks, chunk, crypt,
+                                           schedule))
+        elif mode == TripleDES.CTR:
+            futures.append(executor.submit(_ctrCrypt, chunk, crypt, schedule,
+                                           bytes(iv), position + start))
         else:
-            encrypt = DES(plaintext,key,1)
-        
-        ciphertext = ciphertext + encrypt.to01()
-        low += 64
-        high += 64
-    return bitarray(ciphertext)
+            #each CBC chunk is chained from the ciphertext block before it
+            chunkIv = bytes(iv) if start == 0 else bytes(view[start - 8:start])
+            futures.append(executor.submit(_cbcDecrypt, chunk, crypt, schedule,
+                                           chunkIv))
+    view.release()
+
+    output = bytearray(length)
+    offset = 0
+    for future in futures:
+        result = future.result()
+        output[offset:offset + len(result)] = result
+        offset += len(result)
+    return output
+
+def blockChainDES(ptext,key,mode):
+    return _chainBlocks(ptext, _crypt_block, _schedules(key)[mode])
 
 def blockChainTripleDES(ptext,key1,key2,key3,mode):
-    tmp = True
-    maxlen = len(ptext.to01())
-    low = 0
-    high = 64  
-    cipher = bitarray()
-    ciphertext = ""
-    while (tmp):
-        if high > maxlen:
-            break
-        
-        plaintext = bitarray(ptext.to01()[low:high])
-        if mode == 0: 
-            encrypt = tripleDES(plaintext,key1,key2,key3,0)
-        else:
-            encrypt = tripleDES(plaintext,key1,key2,key3,1)
-        
-        ciphertext = ciphertext + encrypt.to01()
-        low += 64
-        high += 64
-    return bitarray(ciphertext)
+    schedules = _triple_schedules(key1, key2, key3)[mode]
+    return _chainBlocks(ptext, _triple_crypt_block, schedules)
 
 def tripleDES(ptext, key1, key2, key3, mode):
-    if mode == 0:
-        return DES(DES(DES(ptext,key1,0), key2, 1), key3, 0)
-    else:
-        return DES(DES(DES(ptext,key3,1), key2, 0), key1, 1)
+    schedules = _triple_schedules(key1, key2, key3)[mode]
+    return _from_int(_triple_crypt_block(_to_int(ptext), schedules))
     
 
 if __name__ == '__main__':
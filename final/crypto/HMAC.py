@@ -1,52 +1,101 @@
-from bitstring import BitArray
+import copy
+
 from .SHA1 import *
 from . import mac
 
-def Hmac(K,m):
-    """ Computes the HMAC.
+def _padded_hashers(K):
+    """ Absorbs the padded key into a pair of SHA1 hashers, so that MACs can be
+    computed without going over the key again.
     Args:
       K: String representation of the key.
-      m: String representation of the message.
     Returns:
-      The computed HMAC. """
-    key = BitArray(K.encode("latin-1"))
-    mess = BitArray(m.encode("latin-1"))
+      The inner and outer hashers, after absorbing K^ipad and K^opad. """
+    key = K.encode("latin-1")
 
     #shortens key if its larger than the block size of SHA1
-    if (len(key.bin) > 512):
-        key = BitArray(SHA1(key))
+    if (len(key) > 64):
+        key = SHA1Bytes(key)
 
     #pads the key to the size of a block in SHA1
-    if (len(key.bin) < 512):
-        temp = BitArray('0b'+'0'*(512-len(key.bin)))
-        key.append(temp)
+    key = int.from_bytes(key.ljust(64, b"\x00"), "big")
 
     #the outer pad
-    opad = BitArray('0x5c')
-    opad *= 64
-    o_key_pad = key.copy()
-    o_key_pad ^= opad
+    opad = int.from_bytes(b"\x5c" * 64, "big")
+    outer = SHA1Hasher((key ^ opad).to_bytes(64, "big"))
 
     #the inner pad
-    ipad = BitArray('0x36')
-    ipad *= 64
-    i_key_pad = key.copy()
-    i_key_pad ^= ipad
+    ipad = int.from_bytes(b"\x36" * 64, "big")
+    inner = SHA1Hasher((key ^ ipad).to_bytes(64, "big"))
+
+    return inner, outer
+
+def _finish(hashers, m):
+    """ Computes the HMAC from precomputed pad states.
+    Args:
+      hashers: The inner and outer hashers from _padded_hashers().
+      m: The message, as a bytes-like object.
+    Returns:
+      The computed HMAC, as bytes. """
+    inner, outer = hashers
+
+    #hashes the message after the inner pad, then the result after the outer
+    #pad, cloning so that the pad states can be reused
+    inner = inner.copy()
+    inner.update(m)
+    outer = outer.copy()
+    outer.update(inner.digest())
 
-    #pads the message with two hashes
-    result = i_key_pad.copy()
-    result.append(mess)
-    result = BitArray(SHA1(result))
-    temp = o_key_pad.copy()
-    temp.append(result)
+    return outer.digest()
 
-    return SHA1(temp).bytes.decode("latin-1")
+def Hmac(K,m):
+    """ Computes the HMAC.
+    Args:
+      K: String representation of the key.
+      m: String representation of the message.
+    Returns:
+      The computed HMAC. """
+    result = _finish(_padded_hashers(K), m.encode("latin-1"))
+    return result.decode("latin-1")
+
+
+class HmacStream(mac.MacStream):
+    """ Computes an HMAC incrementally, hashing each chunk as it arrives. """
+
+    def __init__(self, hashers):
+        """
+        Args:
+          hashers: The inner and outer hashers from _padded_hashers(). """
+        inner, self.__outer = hashers
+        self.__inner = inner.copy()
+
+    def update(self, data):
+        """ Adds the next chunk of the message.
+        Args:
+          data: The chunk, as a string or a bytes-like object. """
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+        self.__inner.update(data)
+
+    def finalize(self):
+        """ Computes the HMAC of everything passed to update() so far. This can
+        be called more than once.
+        Returns:
+          The computed HMAC. """
+        return self.finalize_bytes().decode("latin-1")
+
+    def finalize_bytes(self):
+        """ Computes the HMAC of everything passed to update() so far.
+        Returns:
+          The computed HMAC, as bytes. """
+        outer = self.__outer.copy()
+        outer.update(self.__inner.digest())
+        return outer.digest()
 
 
 class HMAC(mac.Mac):
 
     def __init__(self,k):
-        self.key = k
+        self.set_key(k)
 
     @classmethod
     def get_name(cls):
@@ -56,10 +105,23 @@ class HMAC(mac.Mac):
         return 20
 
     def generate(self, data):
-        return Hmac(self.key, data)
+        return self.generate_bytes(data.encode("latin-1")).decode("latin-1")
+
+    def generate_bytes(self, data):
+        return _finish(self.__hashers, data)
+
+    def new(self):
+        return HmacStream(self.__hashers)
+
+    def fork_session(self):
+        #the pad states are only ever copied, and set_key() replaces them, so
+        #sessions can share them
+        return copy.copy(self)
 
     def set_key(self, key):
         self.key = key
+        #the key pads only change with the key, so they are hashed once here
+        self.__hashers = _padded_hashers(key)
 
 
 if __name__ == '__main__':
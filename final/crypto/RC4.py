@@ -1,12 +1,40 @@
 from .cryptosystem import Symmetric
 from bitarray import *
+import copy
+import functools
 import secrets
 import math
+import threading
 
 class RC4(Symmetric):
-    def __init__(self, keysize):
+    def __init__(self, keysize, drop=0, continuous=False, buffer_size=65536,
+                 refill_watermark=16384):
+        """
+        Args:
+            keysize (int): The key size, in bits.
+            drop (int): The number of initial keystream bytes to discard
+                        (RC4-drop[n]). Both ends must use the same value.
+            continuous (bool): If true, all messages under a key share one
+                               continuous keystream, instead of each message
+                               restarting it. Both ends must use the same
+                               value, and must process messages in the same
+                               order.
+            buffer_size (int): In continuous mode, how many keystream bytes to
+                               generate ahead of time.
+            refill_watermark (int): In continuous mode, the buffer is topped
+                                    up when fewer than this many bytes are
+                                    left. Must be less than buffer_size. """
+        if continuous:
+            _check_buffer(buffer_size, refill_watermark)
         self.keysize = keysize
+        self.drop = drop
+        self.continuous = continuous
+        self.buffer_size = buffer_size
+        self.refill_watermark = refill_watermark
         self.key = bitarray(keysize)
+        self.buffer = None
+        #Set by close(), until a new key is set
+        self.closed = False
 
     def encrypt(self, message):
         """ Encrypts a message.
@@ -14,31 +42,42 @@ class RC4(Symmetric):
             message (string): The message to encrypt.
         Returns:
             (string) The encrypted message. """
-        k = self.key.tobytes()
-        msg = bitarray(0)
-        msg.frombytes(message.encode('latin-1'))
-        s = list(range(256))
-        j = 0
-        for i in range(256):
-            j = (j + s[i] + k[i%bits2bytes(self.keysize)])%256
-            tmp = s[i]
-            s[i] = s[j]
-            s[j] = tmp
-        m = msg.tobytes()
-        c = bitarray(0)
-        i = 0
-        j = 0
-        for it in range(len(m)):
-            i = (i+1)%256
-            j = (j+s[i])%256
-            tmp = s[i]
-            s[i] = s[j]
-            s[j] = tmp
-            xk = s[(s[i]+s[j])%256]
-            bkey = bitarray(bin(xk).lstrip('0b'))
-            while len(bkey) < 8: bkey.insert(0,False)
-            c.extend(bkey^msg[8*it:8*(it+1)])
-        return c.tobytes().decode('latin-1')
+        return self.encrypt_bytes(message.encode('latin-1')).decode('latin-1')
+
+    def encrypt_bytes(self, message):
+        """ Encrypts a message without converting it to a string.
+        Args:
+            message (bytes-like): The message to encrypt.
+        Returns:
+            (bytes) The encrypted message. """
+        if self.continuous:
+            if self.closed:
+                #A new buffer would start the keystream over under the same
+                #key.
+                raise ValueError("RC4 cipher was closed; set a new key first.")
+            if self.buffer is None:
+                self.buffer = KeystreamBuffer(self.stream(), self.buffer_size,
+                                              self.refill_watermark)
+            stream = self.buffer.take(len(message))
+        else:
+            stream = self.keystream(len(message))
+        return xor_keystream(message, stream)
+
+    def keystream(self, length):
+        """ Generates the start of the keystream for the current key.
+        Args:
+            length (int): The number of keystream bytes to generate.
+        Returns:
+            (bytearray) The keystream. """
+        return self.stream().keystream(length)
+
+    def stream(self):
+        """ Creates a stateful keystream for the current key, which picks up
+        where it left off on every call.
+        Returns:
+            (RC4Stream) The new stream. """
+        k = self.key.tobytes()[:bits2bytes(self.keysize)]
+        return RC4Stream(k, self.drop)
 
     def decrypt(self, message):
         """ Decrypts a message.
@@ -48,6 +87,14 @@ class RC4(Symmetric):
             (string) The decrypted message. """
         return self.encrypt(message)
 
+    def decrypt_bytes(self, message):
+        """ Decrypts a message without converting it to a string.
+        Args:
+            message (bytes-like): The message to decrypt.
+        Returns:
+            (bytes) The decrypted message. """
+        return self.encrypt_bytes(message)
+
     def gen_key(self):
         """ Generates a 56-bit random key for this cryptosystem.
         Args:
@@ -57,6 +104,7 @@ class RC4(Symmetric):
         tmp_key = secrets.randbits(self.keysize)
         for i in range(self.keysize):
             self.key[self.keysize-1-i] = ((tmp_key >> i) & 1)
+        self.__reset_buffer()
         return self.key.tobytes().decode("latin-1")
 
     def set_key(self, new_key):
@@ -65,7 +113,8 @@ class RC4(Symmetric):
             new_key (string): the new key to set. """
         self.key = bitarray()
         self.key.frombytes(new_key.encode("latin-1"))
-        self.keylength = self.key.length()
+        self.keylength = len(self.key)
+        self.__reset_buffer()
 
     def get_key(self):
         """ Get the current gen_key
@@ -75,6 +124,41 @@ class RC4(Symmetric):
             (string) Current key. """
         return self.key.tobytes().decode("latin-1")
 
+    def fork_session(self):
+        """ Creates a copy of this cipher for a new session. The key is copied,
+        since gen_key() changes it in place, but the keystream buffer is not,
+        so each session starts its own when it needs one.
+        Returns:
+            (RC4) The copy. """
+        clone = copy.copy(self)
+        clone.key = bitarray(self.key)
+        clone.buffer = None
+        return clone
+
+    def get_buffer_stats(self):
+        """ Gets statistics for the continuous keystream buffer.
+        Returns:
+            (int, int) The number of requests that were served entirely from
+            the buffer, and the number that had to wait for keystream to be
+            generated. """
+        if self.buffer is None:
+            return 0, 0
+        return self.buffer.hits, self.buffer.misses
+
+    def close(self):
+        """ Stops the keystream buffer, if there is one. In continuous mode,
+        the cipher can't be used again until a new key is set. """
+        self.__reset_buffer()
+        self.closed = True
+
+    def __reset_buffer(self):
+        """ Discards the keystream buffer after the key changes, which also
+        lets a closed cipher be used again. """
+        self.closed = False
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
     @classmethod
     def get_name(cls):
         """ Returns the unique name for this cryptosystem """
@@ -86,6 +170,246 @@ class RC4(Symmetric):
         return 1
 
 
+class RC4Stream:
+    """ An RC4 keystream that keeps its state between calls, so that large or
+    chunked payloads can be processed incrementally. """
+
+    def __init__(self, key, drop=0):
+        """
+        Args:
+            key (bytes): The key.
+            drop (int): The number of initial keystream bytes to discard. """
+        state, self.i, self.j = _initial_state(bytes(key), drop)
+        self.s = list(state)
+
+    def keystream(self, length):
+        """ Generates the next part of the keystream.
+        Args:
+            length (int): The number of bytes to generate.
+        Returns:
+            (bytearray) The keystream. """
+        s = self.s
+        i = self.i
+        j = self.j
+        stream = bytearray(length)
+        for it in range(length):
+            i = (i+1) & 0xff
+            si = s[i]
+            j = (j+si) & 0xff
+            sj = s[j]
+            s[i] = sj
+            s[j] = si
+            stream[it] = s[(si+sj) & 0xff]
+        self.i = i
+        self.j = j
+        return stream
+
+    def update(self, chunk):
+        """ Encrypts or decrypts the next chunk of a message.
+        Args:
+            chunk (bytes-like): The chunk.
+        Returns:
+            (bytes) The processed chunk. """
+        return xor_keystream(chunk, self.keystream(len(chunk)))
+
+    def skip(self, length):
+        """ Advances the keystream without using it.
+        Args:
+            length (int): The number of bytes to skip. """
+        self.keystream(length)
+
+    def copy(self):
+        """
+        Returns:
+            (RC4Stream) An independent stream in the same state as this one. """
+        clone = RC4Stream.__new__(RC4Stream)
+        clone.s = self.s[:]
+        clone.i = self.i
+        clone.j = self.j
+        return clone
+
+
+class KeystreamBuffer:
+    """ Generates keystream ahead of time into a ring buffer, so that most
+    requests are just a copy out of the buffer. A background thread tops the
+    buffer back up whenever it drops below a watermark. """
+
+    #Number of bytes to generate at a time while refilling
+    _REFILL_CHUNK = 4096
+
+    def __init__(self, stream, size, watermark):
+        """
+        Args:
+            stream (RC4Stream): The keystream to buffer. It must not be used
+                                by anything else.
+            size (int): The capacity of the buffer, in bytes.
+            watermark (int): Refill the buffer when fewer than this many bytes
+                             are left in it. Must be less than size. """
+        _check_buffer(size, watermark)
+        self.__stream = stream
+        self.__buffer = bytearray(size)
+        self.__start = 0
+        self.__count = 0
+        self.__watermark = watermark
+        self.__closed = False
+        #Guards the buffer. It is never held while keystream is generated, so
+        #requests that hit the buffer don't wait for a refill.
+        self.__condition = threading.Condition()
+        #Guards the stream, so that keystream is added to the buffer in the
+        #order it was generated. Taken before the condition when both are
+        #needed.
+        self.__stream_lock = threading.Lock()
+
+        #Number of requests served from the buffer, and not
+        self.hits = 0
+        self.misses = 0
+
+        self.__thread = threading.Thread(target=self.__refill_loop, daemon=True)
+        self.__thread.start()
+
+    def take(self, length):
+        """ Gets the next part of the keystream.
+        Args:
+            length (int): The number of bytes to get.
+        Returns:
+            (bytearray) The keystream. """
+        with self.__condition:
+            if length <= self.__count:
+                self.hits += 1
+                return self.__take_buffered(length)
+
+        #Use up what is buffered, and generate the rest right now. Holding the
+        #stream lock means no refill is half done, so nothing that should come
+        #before the new keystream is still on its way into the buffer.
+        with self.__stream_lock:
+            with self.__condition:
+                self.misses += 1
+                stream = self.__take_buffered(min(length, self.__count))
+                stream += self.__stream.keystream(length - len(stream))
+                return stream
+
+    def close(self):
+        """ Stops the refill thread. """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+
+    def __take_buffered(self, length):
+        """ Removes bytes from the front of the buffer, and wakes the refill
+        thread if that leaves it low. Must be called with the condition held.
+        Args:
+            length (int): The number of bytes to remove.
+        Returns:
+            (bytearray) The bytes. """
+        stream = self.__read(length)
+        if self.__count < self.__watermark:
+            self.__condition.notify()
+        return stream
+
+    def __read(self, length):
+        """ Removes bytes from the front of the buffer. Must be called with the
+        lock held.
+        Args:
+            length (int): The number of bytes to remove.
+        Returns:
+            (bytearray) The bytes. """
+        size = len(self.__buffer)
+        end = self.__start + length
+        if end <= size:
+            stream = self.__buffer[self.__start:end]
+        else:
+            stream = self.__buffer[self.__start:] + self.__buffer[:end - size]
+        self.__start = end % size if size else 0
+        self.__count -= length
+        return stream
+
+    def __write(self, stream):
+        """ Adds keystream to the back of the buffer. Must be called with the
+        condition held, and there must be room for it.
+        Args:
+            stream (bytes-like): The keystream. """
+        size = len(self.__buffer)
+        length = len(stream)
+        begin = (self.__start + self.__count) % size
+        first = min(length, size - begin)
+        self.__buffer[begin:begin + first] = stream[:first]
+        self.__buffer[:length - first] = stream[first:]
+        self.__count += length
+
+    def __refill_loop(self):
+        """ Runs in the background, refilling the buffer. """
+        size = len(self.__buffer)
+        filling = False
+        while True:
+            with self.__condition:
+                while not self.__closed and not filling and \
+                        self.__count >= self.__watermark:
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+
+                #Once started, fill all the way up, a chunk at a time
+                filling = True
+                length = min(self._REFILL_CHUNK, size - self.__count)
+
+            #Only take() removes data from the buffer, so there is still room
+            #for the chunk once it has been generated
+            with self.__stream_lock:
+                stream = self.__stream.keystream(length)
+                with self.__condition:
+                    self.__write(stream)
+                    if self.__count >= size:
+                        filling = False
+
+
+def _check_buffer(size, watermark):
+    """ Checks the settings for a keystream buffer. A buffer that is empty,
+    or that always wants more than it can hold, would never stop refilling.
+    Args:
+        size (int): The capacity of the buffer, in bytes.
+        watermark (int): The refill watermark, in bytes. """
+    if size <= 0:
+        raise ValueError("Keystream buffer size must be positive, got %d." % \
+                         (size))
+    if watermark < 0 or watermark >= size:
+        raise ValueError("Refill watermark must be in [0, %d), got %d." % \
+                         (size, watermark))
+
+@functools.lru_cache(maxsize=16)
+def _initial_state(key, drop):
+    """ Runs the key schedule, and discards the first part of the keystream.
+    The result is cached, since the same key is used for a whole session.
+    Args:
+        key (bytes): The key.
+        drop (int): The number of keystream bytes to discard.
+    Returns:
+        (tuple, int, int) The state array, i, and j. """
+    s = list(range(256))
+    j = 0
+    for i in range(256):
+        j = (j + s[i] + key[i%len(key)])%256
+        s[i], s[j] = s[j], s[i]
+
+    stream = RC4Stream.__new__(RC4Stream)
+    stream.s = s
+    stream.i = 0
+    stream.j = 0
+    stream.skip(drop)
+    return tuple(stream.s), stream.i, stream.j
+
+def xor_keystream(data, stream):
+    """ XORs data with a keystream in a single step, by treating both as big
+    integers.
+    Args:
+        data (bytes-like): The data.
+        stream (bytes-like): The keystream. Must be at least as long as data.
+    Returns:
+        (bytes) The result. """
+    length = len(data)
+    stream = int.from_bytes(memoryview(stream)[:length], "big")
+    return (int.from_bytes(data, "big") ^ stream).to_bytes(length, "big")
+
+
 if __name__ == "__main__":
     c = RC4(56)
     a = c.gen_key()
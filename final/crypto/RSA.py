@@ -14,31 +14,28 @@ class RSA(Pkc):
         self.n = 0
 
     def __to_int(self, message):
-      """ Converts a string message to an int.
+      """ Converts a byte message to an int.
       Args:
-        message: The string message to convert.
+        message: The message to convert, as a bytes-like object.
       Returns:
         The message in int form. """
-      # First, convert the message to a byte array.
-      byte_message = message.encode("latin-1")
-      if len(byte_message) > self.keysize // 8:
+      number = int.from_bytes(message, byteorder="little", signed=False)
+      # Anything below the modulus can be encrypted. Checking the value rather
+      # than keysize // 8 also accepts ciphertexts from a modulus that is a bit
+      # longer than the key size.
+      if number >= self.n:
         raise ValueError("Message of length %d must be less than key size." % \
-                         (len(byte_message)))
-
-      # Now, convert to an int.
-      return int.from_bytes(byte_message, byteorder="little", signed=False)
+                         (len(message)))
+      return number
 
     def __from_int(self, message):
-      """ Converts an int message to a string.
+      """ Converts an int message to bytes.
       Args:
         message: The int message to convert.
       Returns:
-        The message in string form. """
-      # First, convert the message to a byte array.
+        The message in byte form. """
       length = (message.bit_length() + 7) // 8
-      byte_message = message.to_bytes(length, byteorder="little", signed=False)
-      # Now, convert to a string.
-      return byte_message.decode("latin-1")
+      return message.to_bytes(length, byteorder="little", signed=False)
 
     def is_prime_MR(self, n, k):
         """ Tests a number to be prime using the Miller Rabin Primality
@@ -145,6 +142,16 @@ class RSA(Pkc):
             message (string): The message to encrypt.
         Returns:
             (string) The encrypted message. """
+        data = message.encode("latin-1")
+        return self.encrypt_public_bytes(data).decode("latin-1")
+
+    def encrypt_public_bytes(self, message):
+        """ Encrypts a message using the public key, without converting it to a
+        string.
+        Args:
+            message (bytes-like): The message to encrypt.
+        Returns:
+            (bytes) The encrypted message. """
         enc = pow(self.__to_int(message), self.e, self.n)
         return self.__from_int(enc)
 
@@ -154,6 +161,16 @@ class RSA(Pkc):
             message (string): The message to encrypt.
         Returns:
             (string) The encrypted message. """
+        data = message.encode("latin-1")
+        return self.encrypt_private_bytes(data).decode("latin-1")
+
+    def encrypt_private_bytes(self, message):
+        """ Encrypts a message using the private key, without converting it to a
+        string.
+        Args:
+            message (bytes-like): The message to encrypt.
+        Returns:
+            (bytes) The encrypted message. """
         enc = pow(self.__to_int(message), self.d, self.n)
         return self.__from_int(enc)
 
@@ -163,6 +180,16 @@ class RSA(Pkc):
             message (string): The message to decrypt.
         Returns:
             (string) The decrypted message. """
+        data = message.encode("latin-1")
+        return self.decrypt_public_bytes(data).decode("latin-1")
+
+    def decrypt_public_bytes(self, message):
+        """ Decrypts a message using the public key, without converting it to a
+        string.
+        Args:
+            message (bytes-like): The message to decrypt.
+        Returns:
+            (bytes) The decrypted message. """
         dec = pow(self.__to_int(message), self.e, self.n)
         return self.__from_int(dec)
 
@@ -172,6 +199,16 @@ class RSA(Pkc):
             message (string): The message to decrypt.
         Returns:
             (string) The decrypted message. """
+        data = message.encode("latin-1")
+        return self.decrypt_private_bytes(data).decode("latin-1")
+
+    def decrypt_private_bytes(self, message):
+        """ Decrypts a message using the private key, without converting it to a
+        string.
+        Args:
+            message (bytes-like): The message to decrypt.
+        Returns:
+            (bytes) The decrypted message. """
         dec = pow(self.__to_int(message), self.d, self.n)
         return self.__from_int(dec)
 
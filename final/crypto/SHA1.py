@@ -1,144 +1,191 @@
+import struct
+
 from bitstring import BitArray
 
+# Initial hash values.
+_H = (0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0)
+
+_MASK = 0xffffffff
+
+
+def _compress(state, block):
+    """ Runs the SHA1 compression function over a single block.
+    Args:
+      state: The current hash state, as a tuple of five 32-bit ints.
+      block: The 64-byte block.
+    Returns:
+      The new hash state. """
+    #splits 512 bit chunk into 16, 32 bit words, then expands to 80 words
+    w = list(struct.unpack(">16I", block))
+    for i in range(16, 80):
+        x = w[i-3] ^ w[i-8] ^ w[i-14] ^ w[i-16]
+        w.append(((x << 1) | (x >> 31)) & _MASK)
+
+    a, b, c, d, e = state
+    for i in range(0, 20):
+        temp = (((a << 5) | (a >> 27)) + (d ^ (b & (c ^ d))) + e + 0x5A827999 +
+                w[i]) & _MASK
+        e = d
+        d = c
+        c = ((b << 30) | (b >> 2)) & _MASK
+        b = a
+        a = temp
+    for i in range(20, 40):
+        temp = (((a << 5) | (a >> 27)) + (b ^ c ^ d) + e + 0x6ED9EBA1 +
+                w[i]) & _MASK
+        e = d
+        d = c
+        c = ((b << 30) | (b >> 2)) & _MASK
+        b = a
+        a = temp
+    for i in range(40, 60):
+        temp = (((a << 5) | (a >> 27)) + ((b & c) | (d & (b | c))) + e +
+                0x8F1BBCDC + w[i]) & _MASK
+        e = d
+        d = c
+        c = ((b << 30) | (b >> 2)) & _MASK
+        b = a
+        a = temp
+    for i in range(60, 80):
+        temp = (((a << 5) | (a >> 27)) + (b ^ c ^ d) + e + 0xCA62C1D6 +
+                w[i]) & _MASK
+        e = d
+        d = c
+        c = ((b << 30) | (b >> 2)) & _MASK
+        b = a
+        a = temp
+
+    #updates h0,h1,h2,h3,h4 so as to cause avalanche effect
+    h0, h1, h2, h3, h4 = state
+    return ((h0 + a) & _MASK, (h1 + b) & _MASK, (h2 + c) & _MASK,
+            (h3 + d) & _MASK, (h4 + e) & _MASK)
+
+def _hash_blocks(state, data):
+    """ Runs the compression function over every block of some data.
+    Args:
+      state: The current hash state.
+      data: The data, a multiple of 64 bytes long.
+    Returns:
+      The new hash state. """
+    view = memoryview(data)
+    for offset in range(0, len(view), 64):
+        state = _compress(state, view[offset:offset + 64])
+    view.release()
+    return state
+
+class SHA1Hasher:
+    """ Incremental SHA1, with the same interface as the hashlib objects. Only
+    a partial block is ever buffered, so messages of any size can be hashed
+    in constant memory. """
+
+    digest_size = 20
+    block_size = 64
+    name = "sha1"
+
+    def __init__(self, data=b""):
+        """
+        Args:
+          data: Optional initial data to hash. """
+        self.__state = _H
+        self.__buffer = bytearray()
+        self.__length = 0
+
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        """ Adds more data to the message.
+        Args:
+          data: The data, as a bytes-like object. """
+        view = memoryview(data)
+        self.__length += len(view)
+
+        if self.__buffer:
+            #completes the block that was partially buffered first
+            needed = 64 - len(self.__buffer)
+            self.__buffer += view[:needed]
+            view = view[needed:]
+            if len(self.__buffer) < 64:
+                return
+            self.__state = _compress(self.__state, self.__buffer)
+            self.__buffer = bytearray()
+
+        full = len(view) - len(view) % 64
+        self.__state = _hash_blocks(self.__state, view[:full])
+        self.__buffer += view[full:]
+
+    def copy(self):
+        """
+        Returns:
+          An independent hasher in the same state as this one. """
+        clone = SHA1Hasher()
+        clone.__state = self.__state
+        clone.__buffer = self.__buffer[:]
+        clone.__length = self.__length
+        return clone
+
+    def digest(self):
+        """ Computes the hash of everything passed to update() so far. The
+        hasher can still be updated afterwards.
+        Returns:
+          The 20-byte message hash, as bytes. """
+        #pads the rest of the message with a 1 bit, zeros, and the length in
+        #bits
+        tail = bytes(self.__buffer) + b"\x80"
+        tail += bytes(-(len(tail) + 8) % 64)
+        tail += struct.pack(">Q", self.__length * 8)
+        return struct.pack(">5I", *_hash_blocks(self.__state, tail))
+
+    def hexdigest(self):
+        """
+        Returns:
+          The message hash, as a hex string. """
+        return self.digest().hex()
+
+def SHA1Bytes(data):
+    """ SHA1 hash function for byte strings.
+    Args:
+      data: The message, as a bytes-like object.
+    Returns:
+      The 20-byte message hash, as bytes. """
+    return SHA1Hasher(data).digest()
+
 def SHA1(m):
     """ SHA1 hash function.
     Args:
-      m: The message, as a BitArray.
+      m: The message, as a BitArray, or anything that a BitArray can be
+         created from.
     Returns:
       The message hash, as a BitArray. """
-    #initialising variables for use in Hash
     mt = BitArray(m)
-    h0 = BitArray('0x67452301')
-    h1 = BitArray('0xEFCDAB89')
-    h2 = BitArray('0x98BADCFE')
-    h3 = BitArray('0x10325476')
-    h4 = BitArray('0xC3D2E1F0')
-    
-    #processing message so that it fits Hash Format
-    m1 = len(mt.bin)
-    m2 = m1
-    if m1%8 == 0:
-        m2 += 1
-        mt.append(BitArray('0b1'))
-    
-    #more processing by adding a pad so message is divisible into 512 bit chunks
-    temp_len = m2%512
-    pad = 0
-    if temp_len < 448:
-        pad = 448-temp_len
-    else:
-        pad = (512-temp_len) + 448
-    
-    padding = BitArray('0b'+'0'*pad)
-    padding.append(BitArray(uint=m1,length=64))   
-    mt.append(padding)
-    
-    pad_len = len(mt.bin)
-    
-    Imin = 0
-    Imax = 512
-    #breaks message into 512 bit chunks and works on each one
-    while Imax <= pad_len:
-        
-        block = BitArray('0b'+mt.bin[Imin:Imax])
-        
-        #splits 512 bit chunk into 16, 32 bit chunks
-        w = [0]*80
-        low = 0
-        up = 16
-        for i in range(16):
-            w[i] = BitArray('0b'+block.bin[low:up])
-            low +=16
-            up += 16
-        
-        #then expands to 80 32 bit chunks
-        for i in range(16,80):
-            temp_BA = w[i-3].copy()
-            temp_BA ^= w[i-8]
-            temp_BA ^= w[i-14]
-            temp_BA ^= w[i-16]
-            temp_BA.rol(1) 
-            w[i] = temp_BA.copy()
-            
-        #initialize hash values for this chunk
-        a = h0.copy()
-        b = h1.copy()
-        c = h2.copy()
-        d = h3.copy()
-        e = h4.copy()
-        
-        for i in range(0,80):
-            #the F function used
-            if 0 <= i <20:
-                tb = b.copy()
-                tb &= c
-                ntb = b.copy()
-                ntb.invert()
-                ntb &= d
-                tb |= ntb
-                fun = tb.copy()
-                k = BitArray('0x5A827999')
-            elif 20 <= i <40:
-                tb = b.copy()
-                tb ^= c
-                tb ^= d
-                fun = tb.copy()
-                k = BitArray('0x6ED9EBA1')
-            elif 40 <= i < 60:
-                tb = b.copy()
-                tb &= c
-                ttb = b.copy()
-                ttb &= d
-                tc = c.copy()
-                tc &= d
-                tb |= ttb
-                tb |= tc
-                fun = tb.copy()
-                k = BitArray('0x8F1BBCDC')
-            elif 60 <= i < 80:
-                tb = b.copy()
-                tb ^= c
-                tb ^= d
-                fun = tb.copy()
-                k = BitArray('0xCA62C1D6')            
-        
-            temp = a.copy()
-            temp.rol(5)
-            temp_val = (temp.uint + fun.uint + e.uint + k.uint + w[i].uint)% 2**32
-            temp = BitArray(uint = temp_val,length = 32)
-            e = d.copy()
-            d = c.copy()
-            c = b.copy()
-            c.rol(30)
-            b = a.copy()
-            a = temp.copy()
-            
-        #updates h0,h1,h2,h3,h4 so as to cause avalanche effect
-        tval = (h0.uint + a.uint)% 2**32
-        h0 = BitArray(uint = tval,length = 32)        
-        tval = (h1.uint + b.uint)% 2**32
-        h1 = BitArray(uint = tval,length = 32) 
-        tval = (h2.uint + c.uint)% 2**32
-        h2 = BitArray(uint = tval,length = 32) 
-        tval = (h3.uint + d.uint)% 2**32
-        h3 = BitArray(uint = tval,length = 32) 
-        tval = (h4.uint + e.uint)% 2**32
-        h4 = BitArray(uint = tval,length = 32) 
-        
-        Imin += 512
-        Imax += 512
-    
-    #combines into 160 bit hash value and returns
-    hh = h0.copy()
-    hh.append(h1)
-    hh.append(h2)
-    hh.append(h3)
-    hh.append(h4)
-    return hh
+    m1 = len(mt)
+    if m1 % 8 == 0:
+        return BitArray(SHA1Bytes(mt.bytes))
+
+    #messages that are not a whole number of bytes are padded bit by bit
+    pad = (447 - m1) % 512
+    mt.append(BitArray('0b1' + '0' * pad))
+    mt.append(BitArray(uint=m1, length=64))
+    return BitArray(struct.pack(">5I", *_hash_blocks(_H, mt.bytes)))
 
 
 
 if __name__ == '__main__':
-    x = 67812786123786127856785437834271826378612352135662317896389987387934869
-    y = "pineapple under the sea"
-    print(SHA1(y.encode()))
+    import hashlib
+    import random
+
+    #checks the implementation against hashlib on random messages
+    for i in range(2000):
+        y = random.randbytes(random.randrange(0, 300))
+        assert SHA1Bytes(y) == hashlib.sha1(y).digest()
+        assert SHA1(y).bytes == hashlib.sha1(y).digest()
+
+        #the same again, fed to the incremental hasher in random pieces
+        hasher = SHA1Hasher()
+        offset = 0
+        while offset < len(y):
+            step = random.randrange(1, 100)
+            hasher.update(y[offset:offset + step])
+            offset += step
+        assert hasher.hexdigest() == hashlib.sha1(y).hexdigest()
+    print(SHA1("pineapple under the sea".encode()))
@@ -3,6 +3,13 @@ from . import SHA1
 import secrets
 
 class SSRSA(RSA):
+    #SSRSA ciphertexts are (int, string) pairs rather than strings, so the byte
+    #methods go through the string ones instead of using RSA's
+    encrypt_public_bytes = Pkc.encrypt_public_bytes
+    encrypt_private_bytes = Pkc.encrypt_private_bytes
+    decrypt_public_bytes = Pkc.decrypt_public_bytes
+    decrypt_private_bytes = Pkc.decrypt_private_bytes
+
     def encrypt_public(self, message):
         """ Encrypts a message using the public key.
         Args:
@@ -45,6 +45,53 @@ class CryptoManager:
     self.__public_contexts[name] = public_context
     self.__private_contexts[name] = private_context
 
+  def fork_session(self):
+    """ Creates a manager for a new session, such as a single client
+    connection. It supports the same algorithms, but has its own keys, nonces
+    and MAC state, so it can be used at the same time as this one. Key pairs
+    and other state that never changes are shared rather than copied, which
+    makes this much cheaper than loading the configuration again.
+    Returns:
+      The new manager. """
+    # Maps the ids of original contexts and components to their forks, so that
+    # anything shared here is shared in the new manager too.
+    forked = {}
+
+    def fork_all(contexts):
+      """ Forks a dictionary of contexts.
+      Args:
+        contexts: The dictionary to fork.
+      Returns:
+        A new dictionary, with the same names mapped to the forks. """
+      forked_contexts = {}
+      for name, context in contexts.items():
+        forked_context = context.fork_session(forked)
+        forked[id(context)] = forked_context
+        forked_contexts[name] = forked_context
+      return forked_contexts
+
+    manager = CryptoManager()
+    manager.__symmetric_contexts = fork_all(self.__symmetric_contexts)
+    manager.__public_contexts = fork_all(self.__public_contexts)
+    manager.__private_contexts = fork_all(self.__private_contexts)
+
+    # Keep any algorithms that were already chosen. Ones that weren't are None,
+    # which is never in the dict.
+    manager.__public_context = forked.get(id(self.__public_context))
+    manager.__private_context = forked.get(id(self.__private_context))
+    manager.__symmetric_context = forked.get(id(self.__symmetric_context))
+
+    return manager
+
+  def close(self):
+    """ Releases anything that the contexts hold for the current session, such
+    as keystream threads. Call it once the session is over. The manager can be
+    used again after a new handshake, which sets new keys. """
+    for contexts in (self.__symmetric_contexts, self.__public_contexts,
+                     self.__private_contexts):
+      for context in contexts.values():
+        context.close()
+
   def choose_algorithms(self, client_pkc, client_symmetric):
     """ Chooses the cipher suite to use for communicating with a client.
     Args:
@@ -1,3 +1,6 @@
+import copy
+
+
 class Cryptosystem:
   """ Common interface for all cryptosystems. """
 
@@ -16,6 +19,19 @@ class Cryptosystem:
       it will favor using this algorithm during the handshake. """
     raise NotImplementedError("get_priority() must be implemented by subclass.")
 
+  def fork_session(self):
+    """ Creates an instance of this cryptosystem for a new session. By default
+    this is a deep copy, but subclasses can share anything that a session
+    never changes.
+    Returns:
+      The new instance. """
+    return copy.deepcopy(self)
+
+  def close(self):
+    """ Releases anything that this instance holds for the current session,
+    such as background threads. By default there is nothing to release. """
+    pass
+
 class Symmetric(Cryptosystem):
   """ Defines a common interface for all symmetric cryptosystems. """
 
@@ -35,6 +51,25 @@ class Symmetric(Cryptosystem):
       The decrypted message. """
     raise NotImplementedError("decrypt() must be implemented by subclass.")
 
+  def encrypt_bytes(self, message):
+    """ Encrypts a message without converting it to a string. By default this
+    goes through encrypt(), so subclasses that work on bytes internally should
+    override it and implement encrypt() on top of it instead.
+    Args:
+      message: The message to encrypt, as a bytes-like object.
+    Returns:
+      The encrypted message, as a bytes-like object. """
+    return self.encrypt(str(message, "latin-1")).encode("latin-1")
+
+  def decrypt_bytes(self, message):
+    """ Decrypts a message without converting it to a string. By default this
+    goes through decrypt().
+    Args:
+      message: The message to decrypt, as a bytes-like object.
+    Returns:
+      The decrypted message, as a bytes-like object. """
+    return self.decrypt(str(message, "latin-1")).encode("latin-1")
+
   def gen_key(self):
     """ Generates an appropriate-length random key for this cryptosystem. The
     key will be set for future use.
@@ -93,6 +128,47 @@ class Pkc(Cryptosystem):
     raise NotImplementedError( \
         "decrypt_private() must be implemented by subclass.")
 
+  def encrypt_public_bytes(self, message):
+    """ Encrypts a message using the public key, without converting it to a
+    string. By default this goes through encrypt_public(), so subclasses that
+    work on bytes internally should override it instead.
+    Args:
+      message: The message to encrypt, as a bytes-like object.
+    Returns:
+      The encrypted message, as a bytes-like object, or unchanged if the
+      cryptosystem does not produce strings. """
+    return encode(self.encrypt_public(str(message, "latin-1")))
+
+  def encrypt_private_bytes(self, message):
+    """ Encrypts a message using the private key, without converting it to a
+    string.
+    Args:
+      message: The message to encrypt, as a bytes-like object.
+    Returns:
+      The encrypted message, as a bytes-like object, or unchanged if the
+      cryptosystem does not produce strings. """
+    return encode(self.encrypt_private(str(message, "latin-1")))
+
+  def decrypt_public_bytes(self, message):
+    """ Decrypts a message using the public key, without converting it to a
+    string.
+    Args:
+      message: The message to decrypt, as a bytes-like object, or as produced
+               by encrypt_private_bytes().
+    Returns:
+      The decrypted message, as a bytes-like object. """
+    return encode(self.decrypt_public(decode(message)))
+
+  def decrypt_private_bytes(self, message):
+    """ Decrypts a message using the private key, without converting it to a
+    string.
+    Args:
+      message: The message to decrypt, as a bytes-like object, or as produced
+               by encrypt_public_bytes().
+    Returns:
+      The decrypted message, as a bytes-like object. """
+    return encode(self.decrypt_private(decode(message)))
+
   def gen_key_pair(self):
     """ Generates a random public-private key pair suitable for this
     cryptosystem. The keys will be set for future use.
@@ -116,6 +192,14 @@ class Pkc(Cryptosystem):
       private_key: The corresponding private key. """
     raise NotImplementedError("set_key_pair() must be implemented by subclass.")
 
+  def fork_session(self):
+    """ The key pair never changes during a session, and the other side's key
+    is only ever used through copy_with_public_key(), so all sessions share
+    this instance.
+    Returns:
+      This instance. """
+    return self
+
   def copy_with_public_key(self, pub_key):
     """ Creates a copy of this same cryptosystem, but with a new public key.
     What happens to the private key is not specified.
@@ -125,3 +209,25 @@ class Pkc(Cryptosystem):
       The new cryptosystem. """
     raise NotImplementedError( \
         "copy_with_public_key() must be implemented by subclass.")
+
+def encode(message):
+  """ Converts a string produced by the string API to bytes. Anything else,
+  such as the tuples that SSRSA produces, is returned unchanged.
+  Args:
+    message: The message to convert.
+  Returns:
+    The message as bytes. """
+  if isinstance(message, str):
+    return message.encode("latin-1")
+  return message
+
+def decode(message):
+  """ Converts a bytes-like message to a string for the string API. Anything
+  else is returned unchanged.
+  Args:
+    message: The message to convert.
+  Returns:
+    The message as a string. """
+  if isinstance(message, (bytes, bytearray, memoryview)):
+    return str(message, "latin-1")
+  return message
@@ -1,3 +1,7 @@
+import copy
+import hmac
+
+
 class Mac:
   """ Generic interface for all MAC algorithms. """
 
@@ -22,8 +26,78 @@ class Mac:
       The generated MAC, as a string. """
     raise NotImplementedError("generate() must be implemented by subclass.")
 
+  def generate_bytes(self, data):
+    """ Generates a new MAC without converting to and from strings. By default
+    this goes through generate(), so subclasses that work on bytes internally
+    should override it instead.
+    Args:
+      data: The message to generate the MAC for, as a bytes-like object.
+    Returns:
+      The generated MAC, as bytes. """
+    return self.generate(str(data, "latin-1")).encode("latin-1")
+
   def set_key(self, key):
     """ Sets a new key to use for the MAC.
     Args:
       key: The new key to set. """
     raise NotImplementedError("set_key() must be implemented by subclass.")
+
+  def fork_session(self):
+    """ Creates an instance of this MAC for a new session, so that setting the
+    key for one session doesn't affect any others. By default this is a deep
+    copy.
+    Returns:
+      The new instance. """
+    return copy.deepcopy(self)
+
+  def new(self):
+    """ Starts computing a MAC incrementally, for messages that are available
+    in chunks.
+    Returns:
+      A MacStream that the message can be fed to. """
+    return MacStream(self)
+
+class MacStream:
+  """ Computes a MAC over a message that is fed in chunk by chunk. This generic
+  version buffers the chunks until the MAC is needed. Algorithms that can
+  process the message as it arrives should override Mac.new(). """
+
+  def __init__(self, mac):
+    """
+    Args:
+      mac: The Mac instance to use. """
+    self.__mac = mac
+    self.__chunks = []
+
+  def update(self, data):
+    """ Adds the next chunk of the message.
+    Args:
+      data: The chunk, as a string or a bytes-like object. """
+    if not isinstance(data, str):
+      data = str(data, "latin-1")
+    self.__chunks.append(data)
+
+  def finalize(self):
+    """ Computes the MAC of everything passed to update() so far. This can be
+    called more than once.
+    Returns:
+      The generated MAC, as a string. """
+    return self.__mac.generate("".join(self.__chunks))
+
+  def finalize_bytes(self):
+    """ Computes the MAC of everything passed to update() so far.
+    Returns:
+      The generated MAC, as bytes. """
+    return self.finalize().encode("latin-1")
+
+  def verify(self, expected):
+    """ Checks the MAC of everything passed to update() so far, in constant
+    time.
+    Args:
+      expected: The MAC that was received with the message, as a string or a
+                bytes-like object.
+    Returns:
+      True if the MAC matches, False otherwise. """
+    if isinstance(expected, str):
+      expected = expected.encode("latin-1")
+    return hmac.compare_digest(self.finalize_bytes(), expected)
@@ -1,3 +1,6 @@
+import copy
+
+
 class Nonce:
   """ Common interface for nonce generators and verifiers. """
 
@@ -8,6 +11,13 @@ class Nonce:
       A unique name for this nonce type. """
     raise NotImplementedError("get_name() must be implemented by subclass.")
 
+  def fork_session(self):
+    """ Creates a copy of this nonce for a new session. By default this is a
+    deep copy.
+    Returns:
+      The copy. """
+    return copy.deepcopy(self)
+
 class NonceGenerator(Nonce):
   """ Interface for generating nonce values. """
 
@@ -1,4 +1,4 @@
-import copy
+from . import cryptosystem
 
 
 class SecureContext:
@@ -20,55 +20,96 @@ class SecureContext:
   def _pad(self, data):
     """ Adds the nonce and MAC to the data.
     Args:
-      data: The raw data.
+      data: The raw data, as a bytes-like object.
     Returns:
-      The data, with the nonce and plaintext appended. """
-    nonce = self._nonce_gen.get()
-    with_nonce = data + nonce
+      The data, with the nonce and MAC appended, as a bytearray. """
+    nonce = self._nonce_gen.get().encode("latin-1")
 
-    mac = self._mac.generate(with_nonce)
-    return with_nonce + mac
+    # The MAC covers the data and the nonce, which are fed to it separately so
+    # they don't have to be joined first.
+    mac = self._mac.new()
+    mac.update(data)
+    mac.update(nonce)
 
-  def _verify(self, data):
+    padded = bytearray(data)
+    padded += nonce
+    padded += mac.finalize_bytes()
+    return padded
+
+  def _verify(self, data, as_view=False):
     """ Takes decrypted data, extracts the nonce and the MAC, and verifies them.
+    Everything is done through views of the data, so nothing is copied except
+    for the returned field.
     Args:
       data: The decrypted data, as returned by _pad().
+      as_view: If true, the field is returned as a memoryview into the data
+               instead of a copy.
     Returns:
-      The base data, without any nonce or MAC. """
+      The base data, without any nonce or MAC, as bytes or as a memoryview. """
     mac_len = self._mac.get_length()
     nonce_len = self._nonce_gen.get_length()
+    view = memoryview(data)
 
     # Extract and verify the MAC.
-    expected_mac = data[-mac_len:]
-    field_and_nonce = data[:-mac_len]
-    actual_mac = self._mac.generate(field_and_nonce)
-    if expected_mac != actual_mac:
-      raise ValueError("MAC %s does not match expected MAC %s." % \
-                       (actual_mac, expected_mac))
+    expected_mac = view[-mac_len:]
+    field_and_nonce = view[:-mac_len]
+    mac = self._mac.new()
+    mac.update(field_and_nonce)
+    if not mac.verify(expected_mac):
+      raise ValueError("MAC %r does not match expected MAC %r." % \
+                       (mac.finalize_bytes(), expected_mac.tobytes()))
 
     # Extract and verify the nonce.
-    nonce = field_and_nonce[-nonce_len:]
+    nonce = str(field_and_nonce[-nonce_len:], "latin-1")
     if not self._nonce_ver.verify(nonce):
       raise ValueError("Nonce %s is invalid." % (nonce))
 
     # Extract and return the field value.
-    return field_and_nonce[:-nonce_len]
+    field = field_and_nonce[:-nonce_len]
+    if as_view:
+      return field
+    return field.tobytes()
 
   def encrypt(self, data):
     """ Encrypts some data.
     Args:
-      data: The data to encrypt.
+      data: The data to encrypt, as a string.
     Returns:
       The encrypted data, as a string. """
-    raise NotImplementedError("encrypt() must be implemented by subclass.")
+    return cryptosystem.decode(self.encrypt_bytes(data.encode("latin-1")))
 
-  def decrypt(self, data):
+  def decrypt(self, data, as_view=False):
     """ Decrypts some data.
     Args:
-      data: The data to decrypt.
+      data: The data to decrypt, as returned by encrypt().
+      as_view: If true, the decrypted data is returned as a memoryview instead
+               of a string, which saves a copy.
     Returns:
       The decrypted data, as a string. """
-    raise NotImplementedError("decrypt() must be implemented by subclass.")
+    field = self.decrypt_bytes(cryptosystem.encode(data), as_view)
+    if as_view:
+      return field
+    return str(field, "latin-1")
+
+  def encrypt_bytes(self, data):
+    """ Encrypts some data without converting it to a string.
+    Args:
+      data: The data to encrypt, as a bytes-like object.
+    Returns:
+      The encrypted data, as a bytes-like object. """
+    raise NotImplementedError( \
+        "encrypt_bytes() must be implemented by subclass.")
+
+  def decrypt_bytes(self, data, as_view=False):
+    """ Decrypts some data without converting it to a string.
+    Args:
+      data: The data to decrypt, as returned by encrypt_bytes().
+      as_view: If true, the decrypted data is returned as a memoryview instead
+               of a copy.
+    Returns:
+      The decrypted data, as a bytes-like object. """
+    raise NotImplementedError( \
+        "decrypt_bytes() must be implemented by subclass.")
 
   def get_name(self):
     """
@@ -94,6 +135,39 @@ class SecureContext:
       The currently-set encryption key for this context. """
     raise NotImplementedError("get_key() must be implemented by subclass.")
 
+  def fork_session(self, forked=None):
+    """ Creates a context for a new session, which can be used independently
+    of this one. Each component is forked only once per call to
+    CryptoManager.fork_session(), so components that several contexts share
+    are shared by their forks as well.
+    Args:
+      forked: Dict that maps the ids of components that were already forked to
+              their forks. It is updated with the ones forked here.
+    Returns:
+      The new context. """
+    if forked is None:
+      forked = {}
+
+    def fork(component):
+      """ Forks a single component, or reuses the fork made earlier.
+      Args:
+        component: The component to fork.
+      Returns:
+        Its fork. """
+      key = id(component)
+      if key not in forked:
+        forked[key] = component.fork_session()
+      return forked[key]
+
+    return type(self)(fork(self._algorithm), fork(self._nonce_gen),
+                      fork(self._nonce_ver), fork(self._mac))
+
+  def close(self):
+    """ Releases anything that the algorithm holds for the current session.
+    Components that are shared with other contexts are left alone, since they
+    don't hold anything. """
+    self._algorithm.close()
+
   def set_mac_key(self, key):
     """ Sets a new key for the MAC.
     Args:
@@ -108,17 +182,17 @@ class SecureContext:
 class SymmetricContext(SecureContext):
   """ SecureContext that uses a symmetric encryption algorithm internally. """
 
-  def encrypt(self, data):
+  def encrypt_bytes(self, data):
     # Add the nonce and MAC.
     padded = self._pad(data)
     # Encrypt the entire thing.
-    return self._algorithm.encrypt(padded)
+    return self._algorithm.encrypt_bytes(padded)
 
-  def decrypt(self, data):
+  def decrypt_bytes(self, data, as_view=False):
     # Decrypt the data.
-    padded = self._algorithm.decrypt(data)
+    padded = self._algorithm.decrypt_bytes(data)
     # Extract and verify the field.
-    return self._verify(padded)
+    return self._verify(padded, as_view)
 
   def gen_key(self):
     """ Generates and sets a new symmetric key for this context.
@@ -138,17 +212,17 @@ class SymmetricContext(SecureContext):
 class PublicKeyContext(SecureContext):
   """ SecureContext that uses the public key from a PKC internally. """
 
-  def encrypt(self, data):
+  def encrypt_bytes(self, data):
     # Add the nonce and MAC.
     padded = self._pad(data)
     # Encrypt the entire thing.
-    return self._algorithm.encrypt_public(padded)
+    return self._algorithm.encrypt_public_bytes(padded)
 
-  def decrypt(self, data):
+  def decrypt_bytes(self, data, as_view=False):
     # Decrypt the data.
-    padded = self._algorithm.decrypt_public(data)
+    padded = self._algorithm.decrypt_public_bytes(data)
     # Extract and verify the field.
-    return self._verify(padded)
+    return self._verify(padded, as_view)
 
   def get_key(self):
     public_key, _ = self._algorithm.get_key_pair()
@@ -160,9 +234,9 @@ class PublicKeyContext(SecureContext):
     Args:
       pub_key: The new public key to use. """
     # Copy everything.
-    nonce_gen = copy.deepcopy(self._nonce_gen)
-    nonce_ver = copy.deepcopy(self._nonce_ver)
-    mac = copy.deepcopy(self._mac)
+    nonce_gen = self._nonce_gen.fork_session()
+    nonce_ver = self._nonce_ver.fork_session()
+    mac = self._mac.fork_session()
 
     # Clone the algorithm with a new public key.
     algorithm = self._algorithm.copy_with_public_key(pub_key)
@@ -173,17 +247,17 @@ class PublicKeyContext(SecureContext):
 class PrivateKeyContext(SecureContext):
   """ SecureContext that uses the private key from a PKC internally. """
 
-  def encrypt(self, data):
+  def encrypt_bytes(self, data):
     # Add the nonce and MAC.
     padded = self._pad(data)
     # Encrypt the entire thing.
-    return self._algorithm.encrypt_private(padded)
+    return self._algorithm.encrypt_private_bytes(padded)
 
-  def decrypt(self, data):
+  def decrypt_bytes(self, data, as_view=False):
     # Decrypt the data.
-    padded = self._algorithm.decrypt_private(data)
+    padded = self._algorithm.decrypt_private_bytes(data)
     # Extract and verify the field.
-    return self._verify(padded)
+    return self._verify(padded, as_view)
 
   def get_key(self):
     _, private_key = self._algorithm.get_key_pair()
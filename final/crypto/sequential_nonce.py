@@ -1,3 +1,4 @@
+import copy
 import math
 import secrets
 
@@ -40,6 +41,10 @@ class SequentialNonceGenerator(nonce.NonceGenerator):
     # Pad the nonce so the length is consistent.
     return "0" * (expected_length - len(nonce)) + nonce
 
+  def fork_session(self):
+    # All the state is in ints, so a shallow copy is enough.
+    return copy.copy(self)
+
   def set_state(self, state):
     """ Sets the state of the nonce generator.
     Args:
@@ -83,3 +88,8 @@ class SequentialNonceVerifier(nonce.NonceGenerator):
       return
 
     self.__generator.generate()
+
+  def fork_session(self):
+    clone = copy.copy(self)
+    clone.__generator = self.__generator.fork_session()
+    return clone
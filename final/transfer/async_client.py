@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import secrets
+
+from . import async_message_passer
+from . import fragments
+from . import protocol_messages as messages
+from . import wire_format
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncClient(async_message_passer.AsyncMessagePasser):
+  """ Client that runs on an asyncio event loop. Use connect() to create one,
+  since the handshake has to be awaited. """
+
+  def __init__(self, reader, writer, crypto_manager,
+               wire_formats=wire_format.SUPPORTED, executor=None):
+    """
+    Args:
+      reader: The StreamReader for the server.
+      writer: The StreamWriter for the server.
+      crypto_manager: The CryptoManager instance to use.
+      wire_formats: The wire formats to offer the server, in order of
+                    preference.
+      executor: The concurrent.futures executor to run cryptographic
+                operations on, or None to use the event loop's default one. """
+    super().__init__(executor)
+
+    self.__reader = reader
+    self.__writer = writer
+    self.__manager = crypto_manager
+    self.__wire_formats = wire_formats
+    # Held while a message is encrypted and written. The symmetric context and
+    # the nonces are stateful, so messages have to be sent one at a time, in
+    # the order that they are encrypted.
+    self.__send_lock = asyncio.Lock()
+
+    self._peer = writer.get_extra_info("peername")
+
+  @classmethod
+  async def connect(cls, host, port, crypto_manager,
+                    wire_formats=wire_format.SUPPORTED, executor=None):
+    """ Connects to a server and performs the handshake.
+    Args:
+      host: The host to connect to.
+      port: The port to connect on.
+      crypto_manager: The CryptoManager instance to use.
+      wire_formats: The wire formats to offer the server, in order of
+                    preference.
+      executor: The executor to run cryptographic operations on.
+    Returns:
+      The connected client. """
+    reader, writer = await asyncio.open_connection(host, port)
+    logger.info("Connected to %s on port %d.", host, port)
+
+    client = cls(reader, writer, crypto_manager, wire_formats, executor)
+    try:
+      await client.__handshake()
+    except BaseException:
+      await client.close()
+      raise
+    return client
+
+  async def close(self):
+    """ Sends any messages that are still queued, and disconnects. """
+    logger.debug("Closing socket.")
+    self.__writer.close()
+    try:
+      await self.__writer.wait_closed()
+    except ConnectionError:
+      pass
+    # Stop anything the session's ciphers are running in the background.
+    self.__manager.close()
+
+  def __create_challenge(self, server_pub_context, challenge, mac_key):
+    """ Generates a session key, and creates the challenge message. This does
+    the public key encryption, so it is run on the executor.
+    Args:
+      server_pub_context: The public key secure context for the server.
+      challenge: The challenge value for the server.
+      mac_key: The MAC key to send to the server.
+    Returns:
+      The ClientChallenge to send. """
+    # Generate a session key.
+    symmetric_context = self.__manager.get_symmetric()
+    session_key = symmetric_context.gen_key()
+
+    # Create the message.
+    client_pub_context, _ = self.__manager.get_pkc()
+    return messages.ClientChallenge.create(server_pub_context,
+        challenge=challenge, pub_key=client_pub_context.get_key(),
+        session_key=session_key, mac_key=mac_key)
+
+  def __answer_challenge(self, response_message, challenge):
+    """ Checks the server's response, and creates the session verification
+    message. This does the private key decryption, so it is run on the
+    executor.
+    Args:
+      response_message: The ServerChallenge from the server.
+      challenge: The challenge value that was sent to the server.
+    Returns:
+      The ClientSessionVerify to send. """
+    symmetric_context = self.__manager.get_symmetric()
+    _, client_priv_context = self.__manager.get_pkc()
+
+    # Verify the challenge value.
+    server_response = response_message.get_encrypted("response",
+                                                     symmetric_context)
+    if server_response != challenge:
+      # The server challenge is not valid.
+      raise RuntimeError("Challenge failed. Expected %s, got %s." % \
+                         (challenge, server_response))
+    logger.debug("Server challenge passed.")
+
+    # Extract the server challenge value.
+    response = response_message.get_encrypted("challenge", client_priv_context)
+
+    # Create the session verification message.
+    return messages.ClientSessionVerify.create(symmetric_context,
+                                               response=response)
+
+  async def __perform_challenge(self, server_pub_context):
+    """ Generates a secure challenge value, and sends it to the server. Then it
+    waits for the server's response and checks that it is valid.
+    Args:
+      server_pub_context: The public key secure context for the server. """
+    # Generate the random challenge value.
+    challenge = secrets.token_hex(40)
+    # Generate a random MAC key.
+    mac_key = secrets.token_hex(40)
+
+    message = await self._run(self.__create_challenge, server_pub_context,
+                              challenge, mac_key)
+    # Send the message.
+    await self._write_message(message, self.__writer)
+
+    # Set the MAC key after the message is sent, so the outgoing message uses
+    # the old MAC.
+    self.__manager.set_mac_keys(mac_key)
+    # This one is not in the manager, and so has to be set manually.
+    server_pub_context.set_mac_key(mac_key)
+
+    # Wait for the response from the server.
+    response_message = await self._read_message(messages.ServerChallenge,
+                                                self.__reader)
+
+    session_message = await self._run(self.__answer_challenge,
+                                      response_message, challenge)
+    # Send the message.
+    await self._write_message(session_message, self.__writer)
+
+  async def __handshake(self):
+    """ Performs the handshake with the server. """
+    # Get the lists of supported algorithms.
+    pkcs = self.__manager.get_supported_pkcs()
+    symmetric = self.__manager.get_supported_symmetric()
+
+    # Send the ClientHello message to start the handshake.
+    client_hello = messages.ClientHello.create(pkc=pkcs,
+                                               symmetric=symmetric,
+                                               formats=self.__wire_formats)
+    await self._write_message(client_hello, self.__writer)
+
+    # Read the ServerHello message.
+    server_hello = await self._read_message(messages.ServerHello,
+                                            self.__reader)
+    # Servers that don't pick a format only understand JSON.
+    self._set_wire_format(server_hello.get("format", wire_format.JSON))
+
+    # Set the appropriate cipher suite.
+    pkc_name = server_hello.get("pkc")
+    symmetric_name = server_hello.get("symmetric")
+    self.__manager.set_algorithms(pkc_name, symmetric_name)
+
+    # Create a new context for the server PKC.
+    server_key = server_hello.get("pub_key")
+    logger.debug("Got server public key: %s", server_key)
+    client_pub_context, _ = self.__manager.get_pkc()
+    server_pub_context = client_pub_context.copy_with_key(server_key)
+
+    # Perform the server challenge.
+    await self.__perform_challenge(server_pub_context)
+
+    logger.info("Session successfully initialized.")
+
+  def __create_message(self, data, fragment=None):
+    """ Encrypts a message. This is run on the executor.
+    Args:
+      data: The data to send.
+      fragment: The fragment header, if the data is one fragment of a larger
+                message.
+    Returns:
+      The SessionMessage to send. """
+    symmetric_context = self.__manager.get_symmetric()
+
+    if fragment is None:
+      return messages.SessionMessage.create(symmetric_context, contents=data)
+    return messages.SessionMessage.create(symmetric_context, contents=data,
+                                          fragment=fragment)
+
+  async def send_message(self, data, flush=True):
+    """ Sends an encrypted message to the server. Messages of any size can be
+    sent, since large ones are split into fragments. It is safe to call this
+    from several tasks at once, but the messages are sent one after another.
+    Args:
+      data: The data to send.
+      flush: If false, this may return before the message is sent, so that it
+             can be sent together with later ones. Call flush() once done
+             sending. """
+    async with self.__send_lock:
+      if len(data) <= fragments.FRAGMENT_SIZE:
+        # Create and send the message.
+        message = await self._run(self.__create_message, data)
+        await self._write_message(message, self.__writer, flush)
+        return
+
+      # Large messages are sent as a sequence of fragments, each encrypted and
+      # MACed on its own. Waiting for the writer after each one means that
+      # only a few of them are ever held in memory.
+      for index, total, fragment in fragments.split(data):
+        header = fragments.format_header(index, total)
+        message = await self._run(self.__create_message, fragment, header)
+        await self._write_message(message, self.__writer)
+
+  async def flush(self):
+    """ Waits until any messages that are being held back are sent. """
+    await self.__writer.drain()
@@ -0,0 +1,76 @@
+import asyncio
+import functools
+
+from . import message_passer
+
+
+class AsyncMessagePasser(message_passer.Framing):
+  """ Superclass for things that send messages over asyncio streams. This is
+  the asyncio counterpart of MessagePasser, and uses the same wire formats. """
+
+  def __init__(self, executor=None):
+    """
+    Args:
+      executor: The concurrent.futures executor to run cryptographic
+                operations on, or None to use the event loop's default one. """
+    self._executor = executor
+    # Address of the other end, for wire traces.
+    self._peer = None
+
+  def _peer_of(self, stream):
+    """ Gets the address of the other end, for wire traces.
+    Args:
+      stream: The stream that a frame was sent or received on.
+    Returns:
+      The address, or None if it is not known. """
+    return self._peer
+
+  async def _run(self, function, *args, **kwargs):
+    """ Runs a blocking function on the executor, so that slow cryptographic
+    operations don't hold up the event loop.
+    Args:
+      function: The function to run.
+      args, kwargs: The arguments to pass to it.
+    Returns:
+      Whatever the function returns. """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(function, *args, **kwargs)
+    return await loop.run_in_executor(self._executor, call)
+
+  async def __read(self, reader, length):
+    """ Reads an entire length of data.
+    Args:
+      reader: The StreamReader to read from.
+      length: The number of bytes to read.
+    Returns:
+      The data that it read, as bytes. """
+    try:
+      return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+      # Client disconnected.
+      raise ConnectionError("Endpoint disconnected.")
+
+  async def _read_message(self, expected_type, reader):
+    """ Waits for and reads the next message from a stream.
+    Args:
+      expected_type: The class of the message that we expect to receive.
+      reader: The StreamReader to read from.
+    Returns:
+      The message that it read. """
+    # Read the header first, and then the body.
+    header = await self.__read(reader, self._header_size())
+    tag, length = self._parse_header(header)
+    body = await self.__read(reader, length)
+    return self._decode_frame(expected_type, reader, tag, body)
+
+  async def _write_message(self, message, writer, flush=True):
+    """ Writes a message to a stream.
+    Args:
+      message: The message to write.
+      writer: The StreamWriter to write to.
+      flush: If false, the message is only buffered by the writer, and this
+             does not wait for it to be sent. """
+    writer.writelines(self._encode_frame(message, writer))
+
+    if flush:
+      await writer.drain()
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import secrets
+
+from . import async_message_passer
+from . import fragments
+from . import protocol_messages as messages
+from . import wire_format
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncClientConnection(async_message_passer.AsyncMessagePasser):
+  """ Handles a single client on the event loop, from the handshake until it
+  disconnects. Waiting for the client costs nothing but memory, while the
+  cryptography runs on the executor. """
+
+  def __init__(self, server, reader, writer, crypto_manager, wire_formats,
+               executor=None):
+    """
+    Args:
+      server: The AsyncServer that accepted the connection.
+      reader: The StreamReader for the client.
+      writer: The StreamWriter for the client.
+      crypto_manager: The CryptoManager to use for this client only.
+      wire_formats: The wire formats that the server is willing to use.
+      executor: The executor to run cryptographic operations on. """
+    super().__init__(executor)
+
+    self.__server = server
+    self.__reader = reader
+    self.__writer = writer
+    self.__manager = crypto_manager
+    self.__wire_formats = wire_formats
+    # Collects fragmented messages from this client.
+    self.__reassembler = fragments.Reassembler()
+
+    self._peer = writer.get_extra_info("peername")
+
+  async def run(self):
+    """ Performs the handshake, and then services all the client's requests
+    until it disconnects. """
+    try:
+      # Perform the handshake. Every connection starts out with JSON.
+      self._set_wire_format(wire_format.JSON)
+      await self.__handshake()
+
+      # Receive messages.
+      while True:
+        try:
+          await self.__receive_message()
+        except ConnectionError:
+          logger.info("Client disconnected.")
+          # Drop any message that was cut off.
+          self.__reassembler.reset()
+          break
+    finally:
+      # Stop anything the session's ciphers are running in the background.
+      self.__manager.close()
+
+  def __answer_challenge(self, challenge_message):
+    """ Decrypts the client's challenge, and creates the response to it. This
+    does all the private key operations, so it is run on the executor.
+    Args:
+      challenge_message: The ClientChallenge from the client.
+    Returns:
+      The ServerChallenge to send, and the challenge value that the client
+      has to send back. """
+    # Create a new context for the client PKC.
+    client_key = challenge_message.get("pub_key")
+    logger.debug("Got client public key: %s", client_key)
+    server_pub_context, server_priv_context = self.__manager.get_pkc()
+    client_pub_context = server_pub_context.copy_with_key(client_key)
+
+    # Set the session key.
+    symmetric_context = self.__manager.get_symmetric()
+    session_key = challenge_message.get_encrypted("session_key",
+                                                  server_priv_context)
+    symmetric_context.set_key(session_key)
+
+    # Extract the challenge value.
+    response = challenge_message.get_encrypted("challenge",
+                                               server_priv_context)
+    # Create a challenge value for the client.
+    client_challenge = secrets.token_hex(40)
+
+    # Set the MAC key.
+    mac_key = challenge_message.get_encrypted("mac_key",
+                                              server_priv_context)
+    self.__manager.set_mac_keys(mac_key)
+    # This one is not in the manager, and so has to be set manually.
+    client_pub_context.set_mac_key(mac_key)
+
+    # Create the response message.
+    response_message = messages.ServerChallenge.create( \
+        client_pub_context, symmetric_context,
+        response=response, challenge=client_challenge)
+    return response_message, client_challenge
+
+  async def __handle_challenge(self):
+    """ Handles the challenge from the client. """
+    # Wait for the challenge message.
+    challenge_message = await self._read_message(messages.ClientChallenge,
+                                                 self.__reader)
+
+    response_message, client_challenge = \
+        await self._run(self.__answer_challenge, challenge_message)
+    # Send the message.
+    await self._write_message(response_message, self.__writer)
+
+    # Receive the session verification message.
+    session_message = await self._read_message(messages.ClientSessionVerify,
+                                               self.__reader)
+
+    # Verify the challenge value.
+    symmetric_context = self.__manager.get_symmetric()
+    client_response = await self._run(session_message.get_encrypted,
+                                      "response", symmetric_context)
+    if client_response != client_challenge:
+      # The client challenge is not valid.
+      raise RuntimeError("Challenge failed. Expected %s, got %s." % \
+                         (client_challenge, client_response))
+    logger.debug("Client challenge passed.")
+
+  async def __handshake(self):
+    """ Performs the handshake with the client. """
+    # Wait for a ClientHello message.
+    client_hello = await self._read_message(messages.ClientHello,
+                                            self.__reader)
+
+    # Determine what cryptosystems to use.
+    client_pkcs = client_hello.get("pkc")
+    client_symmetric = client_hello.get("symmetric")
+    if not self.__manager.choose_algorithms(client_pkcs, client_symmetric):
+      # We couldn't find a match for one of them.
+      raise RuntimeError("Could not find cipher suite match for client.")
+
+    server_public, _ = self.__manager.get_pkc()
+    server_symmetric = self.__manager.get_symmetric()
+
+    # Send the ServerHello message.
+    # Clients that don't offer any formats only understand JSON.
+    chosen_format = wire_format.choose(client_hello.get("formats", []),
+                                       self.__wire_formats)
+    server_hello = messages.ServerHello.create( \
+        pkc=server_public.get_name(), symmetric=server_symmetric.get_name(),
+        pub_key=server_public.get_key(), format=chosen_format)
+    await self._write_message(server_hello, self.__writer)
+    # Everything after the ServerHello uses the chosen format.
+    self._set_wire_format(chosen_format)
+
+    # Handle the challenge from the client.
+    await self.__handle_challenge()
+
+    logger.info("Session successfully initialized.")
+
+  def __process_message(self, message):
+    """ Decrypts a message from the client, and adds it to the fragmented
+    message if it is part of one. This is run on the executor.
+    Args:
+      message: The SessionMessage from the client.
+    Returns:
+      The contents of the message and None if it was not fragmented.
+      Otherwise, None and either None, or the length and file of the complete
+      message, as returned by Reassembler.add(). """
+    # Extract the message contents.
+    symmetric_context = self.__manager.get_symmetric()
+    contents = message.get_encrypted("contents", symmetric_context)
+
+    if message.get("fragment", None) is None:
+      if self.__reassembler.in_progress():
+        self.__reassembler.reset()
+        raise ValueError("Got a message in the middle of a fragmented one.")
+      return contents, None
+
+    # This is one fragment of a larger message.
+    header = message.get_encrypted("fragment", symmetric_context)
+    index, total = fragments.parse_header(header)
+    logger.debug("Got fragment %d of %d.", index + 1, total)
+
+    return None, self.__reassembler.add(index, total, contents)
+
+  async def __receive_message(self):
+    """ Receives and displays a message from the client. """
+    # Wait for a message.
+    message = await self._read_message(messages.SessionMessage, self.__reader)
+
+    contents, complete = await self._run(self.__process_message, message)
+    if contents is not None:
+      logger.info("Got message: %s", contents)
+    elif complete is not None:
+      length, message_file = complete
+      with message_file:
+        await self.__server._handle_large_message(length, message_file)
+
+class AsyncServer:
+  """ Server that runs on an asyncio event loop. Every client is served by a
+  coroutine, so a single thread can hold thousands of mostly idle sessions.
+  The cryptography is run on an executor, so that it doesn't block the loop. """
+
+  def __init__(self, port, crypto_manager, wire_formats=wire_format.SUPPORTED,
+               executor=None):
+    """
+    Args:
+      port: The port to listen on.
+      crypto_manager: The CryptoManager instance to use. Each client gets its
+                      own fork of it.
+      wire_formats: The wire formats that the server is willing to use.
+      executor: The concurrent.futures executor to run cryptographic
+                operations on, or None to use the event loop's default one. """
+    self.__port = port
+    self.__manager = crypto_manager
+    self.__wire_formats = wire_formats
+    self.__executor = executor
+    self.__trace_preview = async_message_passer.AsyncMessagePasser. \
+        _trace_preview
+
+    self.__server = None
+
+  def set_trace_preview(self, length):
+    """ Sets how much of each frame is shown in wire traces.
+    Args:
+      length: The number of bytes to show, or None to show whole frames. """
+    self.__trace_preview = length
+
+  async def _handle_large_message(self, length, message_file):
+    """ Called when all the fragments of a large message have been received.
+    Args:
+      length: The length of the message.
+      message_file: A binary file object to read the message from. It is
+                    closed once this returns. """
+    logger.info("Got message of length %d.", length)
+
+  async def start(self):
+    """ Starts listening for clients. They are served in the background until
+    close() is called. """
+    self.__server = await asyncio.start_server(self.__serve, port=self.__port)
+    logger.info("Server listening on port %d.", self.__port)
+
+  async def serve_forever(self):
+    """ Serves clients until the task running this is cancelled. """
+    if self.__server is None:
+      await self.start()
+
+    async with self.__server:
+      await self.__server.serve_forever()
+
+  def close(self):
+    """ Stops accepting any more clients. Clients that are already connected
+    are served until they disconnect. """
+    if self.__server is not None:
+      self.__server.close()
+
+  async def __serve(self, reader, writer):
+    """ Serves a single client.
+    Args:
+      reader: The StreamReader for the client.
+      writer: The StreamWriter for the client. """
+    addr = writer.get_extra_info("peername")
+    logger.info("Got connection from %s.", addr)
+
+    try:
+      # Each client gets its own keys, nonces, and MAC state.
+      crypto_manager = self.__manager.fork_session()
+
+      connection = AsyncClientConnection(self, reader, writer, crypto_manager,
+                                         self.__wire_formats, self.__executor)
+      connection.set_trace_preview(self.__trace_preview)
+      await connection.run()
+    except Exception:
+      logger.exception("Error while serving %s.", addr)
+    finally:
+      writer.close()
+      try:
+        await writer.wait_closed()
+      except ConnectionError:
+        pass
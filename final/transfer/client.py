@@ -2,8 +2,11 @@ import logging
 import secrets
 import socket
 
+from . import fragments
 from . import message_passer
 from . import protocol_messages as messages
+from . import tickets
+from . import wire_format
 
 
 logger = logging.getLogger(__name__)
@@ -12,27 +15,49 @@ logger = logging.getLogger(__name__)
 class Client(message_passer.MessagePasser):
   """ This class handles the main client functionality. """
 
-  def __init__(self, host, port, crypto_manager):
+  def __init__(self, host, port, crypto_manager,
+               wire_formats=wire_format.SUPPORTED, ticket=None):
     """
     Args:
       host: The host to connect to.
       port: The port to connect on.
-      crypto_manager: The CryptoManager instance to use. """
+      crypto_manager: The CryptoManager instance to use.
+      wire_formats: The wire formats to offer the server, in order of
+                    preference.
+      ticket: A Ticket from get_ticket() on an earlier connection to the same
+              server. If the server accepts it, the public key part of the
+              handshake is skipped. """
+    super().__init__()
+
+    # Set before connecting, since __del__ closes it even if that fails.
+    self.__manager = crypto_manager
+
     # Create the socket.
     self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     # Connect to the server.
     self.__socket.connect((host, port))
 
-    logger.info("Connected to %s on port %d." % (host, port))
+    logger.info("Connected to %s on port %d.", host, port)
 
-    self.__manager = crypto_manager
+    self.__wire_formats = wire_formats
+    # The ticket for resuming this session later, if the server sent one.
+    self.__ticket = None
+    self.__resumed = False
 
     # Perform the handshake.
-    self.__handshake()
+    self.__handshake(ticket)
 
   def __del__(self):
+    try:
+      # Don't lose any messages that are still queued.
+      self.flush()
+    except socket.error:
+      pass
+
     logger.debug("Closing socket.")
     self.__socket.close()
+    # Stop anything the session's ciphers are running in the background.
+    self.__manager.close()
 
   def __perform_challenge(self, server_pub_context):
     """ Generates a secure challenge value, and sends it to the server. Then it
@@ -75,6 +100,11 @@ class Client(message_passer.MessagePasser):
                          (challenge, server_response))
     logger.debug("Server challenge passed.")
 
+    self.__ticket = self.__receive_ticket(response_message,
+                                          server_pub_context.get_name(),
+                                          symmetric_context, session_key,
+                                          mac_key)
+
     # Extract the server challenge value.
     response = response_message.get_encrypted("challenge", client_priv_context)
 
@@ -84,19 +114,91 @@ class Client(message_passer.MessagePasser):
     # Send the message.
     self._write_message(session_message, self.__socket)
 
-  def __handshake(self):
-    """ Performs the handshake with the server. """
+  def __receive_ticket(self, message, pkc_name, symmetric_context,
+                       session_key, mac_key):
+    """ Extracts the session ticket from a message, if it has one.
+    Args:
+      message: The ServerChallenge or ServerHello that may have a ticket.
+      pkc_name: The name of the PKC for the session.
+      symmetric_context: The symmetric context that the ticket is encrypted
+                         with.
+      session_key: The session key that the ticket is for.
+      mac_key: The MAC key that the ticket is for.
+    Returns:
+      The Ticket, or None if there is none. """
+    if message.get("ticket", None) is None:
+      return None
+
+    ticket_id = message.get_encrypted("ticket", symmetric_context)
+    return tickets.Ticket(ticket_id, pkc_name, symmetric_context.get_name(),
+                          session_key, mac_key, message.get("ticket_lifetime"))
+
+  def __finish_resumption(self, server_hello, ticket, client_nonce):
+    """ Checks the server's proof that it has the ticket, and switches to the
+    keys of the resumed session.
+    Args:
+      server_hello: The resumed ServerHello from the server.
+      ticket: The ticket that the session was resumed from.
+      client_nonce: The nonce that was sent to the server. """
+    server_nonce = server_hello.get("server_nonce")
+    if not ticket.check_server_proof(client_nonce, server_nonce,
+                                     server_hello.get("proof")):
+      raise RuntimeError("Server could not prove that it has the ticket.")
+    logger.debug("Server proof passed.")
+
+    # Derive the same new keys as the server.
+    session_key, mac_key = ticket.derive_keys(client_nonce, server_nonce)
+    symmetric_context = self.__manager.get_symmetric()
+    symmetric_context.set_key(session_key)
+    self.__manager.set_mac_keys(mac_key)
+
+    # The new ticket is encrypted with the new keys.
+    self.__ticket = self.__receive_ticket(server_hello, ticket.pkc,
+                                          symmetric_context, session_key,
+                                          mac_key)
+
+    self.__resumed = True
+
+  def __handshake(self, ticket):
+    """ Performs the handshake with the server.
+    Args:
+      ticket: The Ticket to try to resume the session from, or None. """
     # Get the lists of supported algorithms.
     pkcs = self.__manager.get_supported_pkcs()
     symmetric = self.__manager.get_supported_symmetric()
+    hello_fields = {"pkc": pkcs, "symmetric": symmetric,
+                    "formats": self.__wire_formats, "resumption": True}
+
+    # Offer the ticket if there is one that we can use. The algorithms from
+    # it are set on a fork of the manager, which is only used if the server
+    # accepts the ticket.
+    resumed_manager = None
+    if ticket is not None and not ticket.expired() and \
+       ticket.pkc in pkcs and ticket.symmetric in symmetric:
+      resumed_manager = self.__manager.fork_session()
+      resumed_manager.set_algorithms(ticket.pkc, ticket.symmetric)
+
+      client_nonce = secrets.token_hex(32)
+      hello_fields.update(ticket=ticket.ticket_id, client_nonce=client_nonce,
+                          proof=ticket.client_proof(client_nonce))
+    client_hello = messages.ClientHello.create(**hello_fields)
 
     # Send the ClientHello message to start the handshake.
-    client_hello = messages.ClientHello.create(pkc=pkcs,
-                                               symmetric=symmetric)
     self._write_message(client_hello, self.__socket)
 
     # Read the ServerHello message.
     server_hello = self._read_message(messages.ServerHello, self.__socket)
+    # Servers that don't pick a format only understand JSON.
+    self._set_wire_format(server_hello.get("format", wire_format.JSON))
+
+    if server_hello.get("resumed", False):
+      if resumed_manager is None:
+        raise RuntimeError("Server resumed a session that was not offered.")
+
+      self.__manager = resumed_manager
+      self.__finish_resumption(server_hello, ticket, client_nonce)
+      logger.info("Session resumed from ticket.")
+      return
 
     # Set the appropriate cipher suite.
     pkc_name = server_hello.get("pkc")
@@ -105,7 +207,7 @@ class Client(message_passer.MessagePasser):
 
     # Create a new context for the server PKC.
     server_key = server_hello.get("pub_key")
-    logger.debug("Got server public key: %s" % (server_key))
+    logger.debug("Got server public key: %s", server_key)
     client_pub_context, _ = self.__manager.get_pkc()
     server_pub_context = client_pub_context.copy_with_key(server_key)
 
@@ -114,12 +216,47 @@ class Client(message_passer.MessagePasser):
 
     logger.info("Session successfully initialized.")
 
-  def send_message(self, data):
-    """ Sends an encrypted message to the server.
+  def send_message(self, data, flush=True):
+    """ Sends an encrypted message to the server. Messages of any size can be
+    sent, since large ones are split into fragments.
     Args:
-      data: The data to send. """
+      data: The data to send.
+      flush: If false, the message may be held back and sent together with
+             later ones. Call flush() once done sending. """
     symmetric_context = self.__manager.get_symmetric()
 
-    # Create and send the message.
-    message = messages.SessionMessage.create(symmetric_context, contents=data)
-    self._write_message(message, self.__socket)
+    if len(data) <= fragments.FRAGMENT_SIZE:
+      # Create and send the message.
+      message = messages.SessionMessage.create(symmetric_context, contents=data)
+      self._write_message(message, self.__socket, flush)
+      return
+
+    # Large messages are sent as a sequence of fragments, each encrypted and
+    # MACed on its own. They are batched up, and sent as the queue fills.
+    for index, total, fragment in fragments.split(data):
+      header = fragments.format_header(index, total)
+      message = messages.SessionMessage.create(symmetric_context,
+                                               contents=fragment,
+                                               fragment=header)
+      self._write_message(message, self.__socket, False)
+
+    if flush:
+      self.flush()
+
+  def flush(self):
+    """ Sends any messages that are being held back. """
+    self._flush(self.__socket)
+
+  def get_ticket(self):
+    """
+    Returns:
+      The Ticket to pass to the next Client for the same server, so that it
+      can resume this session, or None if the server didn't issue one. Each
+      ticket can only be used once. """
+    return self.__ticket
+
+  def is_resumed(self):
+    """
+    Returns:
+      True if this session was resumed from a ticket. """
+    return self.__resumed
@@ -0,0 +1,138 @@
+import tempfile
+
+
+# Amount of plaintext carried by each fragment. Even if every encrypted byte is
+# escaped as \uXXXX, a fragment still fits in a JSON frame, so this can't grow
+# much. The parallel_threshold of TripleDES has to be at most this for
+# fragments to be split across worker processes.
+FRAGMENT_SIZE = 128 * 1024
+# Reassembled messages are kept in memory up to this size, and are moved to a
+# temporary file after that.
+SPOOL_SIZE = 8 * 1024 * 1024
+
+
+def split(data, fragment_size=FRAGMENT_SIZE):
+  """ Splits a message into fragments.
+  Args:
+    data: The message to split.
+    fragment_size: The largest size of each fragment.
+  Returns:
+    A generator of (index, total, fragment) tuples. """
+  total = max(1, (len(data) + fragment_size - 1) // fragment_size)
+  for index in range(total):
+    offset = index * fragment_size
+    yield index, total, data[offset:offset + fragment_size]
+
+def format_header(index, total):
+  """ Creates the header that goes with a fragment.
+  Args:
+    index: The index of the fragment.
+    total: The total number of fragments in the message.
+  Returns:
+    The header, as a string. """
+  return "%d/%d" % (index, total)
+
+def parse_header(header):
+  """ Parses a fragment header.
+  Args:
+    header: The header, as created by format_header().
+  Returns:
+    The index of the fragment, and the total number of fragments. """
+  try:
+    index, total = header.split("/")
+    return int(index), int(total)
+  except ValueError:
+    raise ValueError("Invalid fragment header %r." % (header))
+
+
+class Reassembler:
+  """ Puts the fragments of a large message back together. The fragments have
+  to arrive in order. Data is moved to a temporary file once it gets large, so
+  memory use stays bounded however big the message is. """
+
+  def __init__(self, spool_size=SPOOL_SIZE):
+    """
+    Args:
+      spool_size: How much of the message to keep in memory, in bytes. """
+    self.__spool_size = spool_size
+    self.__file = None
+    self.__next_index = 0
+    self.__total = 0
+    self.__length = 0
+
+  def in_progress(self):
+    """
+    Returns:
+      True if some, but not all, of the fragments of a message were added. """
+    return self.__file is not None
+
+  def add(self, index, total, fragment):
+    """ Adds the next fragment of the message.
+    Args:
+      index: The index of the fragment.
+      total: The total number of fragments in the message.
+      fragment: The fragment data, as a string.
+    Returns:
+      None if more fragments are expected. Otherwise, the length of the
+      complete message and a binary file object that it can be read from,
+      positioned at the start. The caller is responsible for closing it. """
+    if self.__file is None:
+      if index != 0 or total < 1:
+        raise ValueError("Fragment %d/%d does not start a message." % \
+                         (index, total))
+      self.__file = tempfile.SpooledTemporaryFile( \
+          max_size=self.__spool_size)
+      self.__total = total
+      self.__length = 0
+    elif index != self.__next_index or total != self.__total:
+      error = "Expected fragment %d/%d, got %d/%d." % \
+              (self.__next_index, self.__total, index, total)
+      self.reset()
+      raise ValueError(error)
+
+    self.__file.write(fragment.encode("latin-1"))
+    self.__length += len(fragment)
+    self.__next_index = index + 1
+    if self.__next_index < self.__total:
+      return None
+
+    # The message is complete.
+    message_file = self.__file
+    message_file.seek(0)
+    self.__file = None
+    self.__next_index = 0
+    return self.__length, message_file
+
+  def reset(self):
+    """ Discards a partially-received message. """
+    if self.__file is not None:
+      self.__file.close()
+    self.__file = None
+    self.__next_index = 0
+
+
+if __name__ == "__main__":
+  assert parse_header(format_header(2, 5)) == (2, 5)
+  for header in ("", "1", "1/2/3", "a/b"):
+    try:
+      parse_header(header)
+    except ValueError as error:
+      print("Rejected header: %s" % (error))
+    else:
+      raise AssertionError("Header %r was accepted." % (header))
+
+  # Fragments that arrive out of order are dropped, and the next message can
+  # still be received.
+  reassembler = Reassembler()
+  reassembler.add(0, 2, "a")
+  try:
+    reassembler.add(0, 2, "b")
+  except ValueError as error:
+    print("Rejected fragment: %s" % (error))
+  else:
+    raise AssertionError("Fragment was accepted.")
+  assert not reassembler.in_progress()
+
+  length, message_file = reassembler.add(0, 1, "hello")
+  with message_file:
+    assert (length, message_file.read()) == (5, b"hello")
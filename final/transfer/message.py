@@ -1,12 +1,25 @@
 import json
 
+from . import wire_format
+
+
+# Marks parameters that have no default value.
+_REQUIRED = object()
+# Longest JSON message whose length fits in the six digit prefix.
+_MAX_JSON_LENGTH = 999999
+
 
 class Message:
   """ Implements a message that can be sent over the wire.
   Here is a brief description of the protocol:
     - First six characters are the message length, padded with leading zeros,
       which does not include the MAC.
-    - Next length characters are JSON-serialized message. """
+    - Next length characters are JSON-serialized message.
+  Once the handshake picks the binary wire format, messages are instead sent as
+  binary frames, as described in wire_format. """
+
+  # Identifies the message type in binary frames.
+  TYPE_TAG = 0
 
   @classmethod
   def deserialize_from(cls, message):
@@ -17,7 +30,30 @@ class Message:
       The deserialized message, as a new instance of cls. """
     # Extract the message.
     raw_message = json.loads(message)
+    return cls.__from_raw_message(raw_message)
+
+  @classmethod
+  def deserialize_binary_from(cls, tag, body):
+    """ Deserializes a message in the binary format.
+    Args:
+      tag: The type tag from the frame header.
+      body: The body of the frame, as a bytes-like object.
+    Returns:
+      The deserialized message, as a new instance of cls. """
+    if tag != cls.TYPE_TAG:
+      raise ValueError("Expected message type %d, got %d." % \
+                       (cls.TYPE_TAG, tag))
 
+    raw_message = wire_format.unpack(body)
+    return cls.__from_raw_message(raw_message)
+
+  @classmethod
+  def __from_raw_message(cls, raw_message):
+    """ Creates a received message from its raw form.
+    Args:
+      raw_message: The deserialized message dict.
+    Returns:
+      The new instance of cls. """
     # Create the new instance.
     message = cls._from_raw(raw_message)
     # Mark that we haven't updated the nonce for this message yet.
@@ -50,13 +86,17 @@ class Message:
       The message as a dictionary. """
     raise NotImplementedError("get_raw() must be implemented by subclass.")
 
-  def get(self, name):
+  def get(self, name, default=_REQUIRED):
     """ Gets a parameter from the message.
     Args:
       name: The name of the parameter.
+      default: Value to return if the parameter is missing. If this is not
+               given, a missing parameter raises a KeyError.
     Returns:
       The value of the parameter. """
-    return self._get_raw()[name]
+    if default is _REQUIRED:
+      return self._get_raw()[name]
+    return self._get_raw().get(name, default)
 
   def get_encrypted(self, name, secure_context):
     """ Gets an encrypted parameter from the message.
@@ -81,6 +121,25 @@ class Message:
     # Serialize the core message.
     raw_message = self._get_raw()
     string_message = json.dumps(raw_message)
+    if len(string_message) > _MAX_JSON_LENGTH:
+      raise ValueError("Message of length %d does not fit in a JSON frame." % \
+                       (len(string_message)))
 
     # Build the full message, with the length.
     return "%06d%s" % (len(string_message), string_message)
+
+  def serialize_binary(self):
+    """
+    Returns:
+      The message as a binary frame, in bytes. This is ready to send over a
+      socket as-is. """
+    header, body = self.serialize_binary_parts()
+    return header + body
+
+  def serialize_binary_parts(self):
+    """ Same as serialize_binary(), but without joining the header and the
+    body, so they can be sent without copying.
+    Returns:
+      The frame header and the frame body. """
+    body = wire_format.pack(self._get_raw())
+    return wire_format.HEADER.pack(self.TYPE_TAG, len(body)), body
@@ -1,13 +1,336 @@
 import logging
 import socket
+import weakref
+
+from . import wire_format
 
 
 logger = logging.getLogger(__name__)
+# Logs the contents of the frames that are sent and received. Each record has
+# a "peer" attribute with the address of the other end, so a logging.Filter can
+# limit tracing to particular connections.
+wire_logger = logging.getLogger("final.transfer.wire")
+
+# Largest frame that is accepted. The length of a frame comes from the other
+# end, so it is checked before anything is allocated for the body. Every
+# message has to fit in a JSON frame, whose length has six digits, so this
+# leaves room for anything that can legitimately be sent.
+MAX_FRAME_SIZE = 1 << 20
+
+
+def _tracing():
+  """ Formatting large frames is slow, so the wire logger only traces when its
+  own level is set to DEBUG, not when debug logging is turned on everywhere.
+  Returns:
+    True if frames should be traced. """
+  return logging.NOTSET < wire_logger.level <= logging.DEBUG and \
+         wire_logger.isEnabledFor(logging.DEBUG)
+
+def _check_length(length):
+  """ Checks the length of a received frame, before its body is read.
+  Args:
+    length: The length from the frame header. """
+  if not 0 <= length <= MAX_FRAME_SIZE:
+    raise ValueError("Frame length %d is not between 0 and %d." % \
+                     (length, MAX_FRAME_SIZE))
+
+
+class ReceiveBuffer:
+  """ Buffers the data received on a socket. Each recv asks for as much data as
+  the buffer has room for, so small messages usually arrive together with the
+  ones after them, and don't need separate calls for the length and the body.
+  """
+
+  # Default number of bytes to ask for on each recv.
+  READ_SIZE = 65536
+
+  def __init__(self, sock, read_size=READ_SIZE):
+    """
+    Args:
+      sock: The socket to read from.
+      read_size: The smallest amount of data to ask for on each recv. """
+    self.__sock = sock
+    self.__read_size = read_size
+    self.__buffer = bytearray(read_size)
+    # Unread data lies between these offsets.
+    self.__start = 0
+    self.__end = 0
+
+  def read(self, length):
+    """ Reads an entire length of data, waiting for it if needed.
+    Args:
+      length: The number of bytes to read.
+    Returns:
+      A memoryview of the data. It is only valid until the next call. """
+    if self.__end - self.__start < length:
+      self.__fill(length)
+
+    start = self.__start
+    self.__start += length
+    return memoryview(self.__buffer)[start:self.__start]
+
+  def __fill(self, length):
+    """ Receives data until at least length bytes are buffered.
+    Args:
+      length: The number of bytes that need to be buffered. """
+    buffered = self.__end - self.__start
+    capacity = max(length, self.__read_size)
+    if len(self.__buffer) != capacity:
+      # Grow the buffer for a large message, or shrink it back after one.
+      # Views returned by read() may still point at the old buffer, so it is
+      # replaced instead of being resized.
+      new_buffer = bytearray(capacity)
+      new_buffer[:buffered] = self.__buffer[self.__start:self.__end]
+      self.__buffer = new_buffer
+      self.__start = 0
+      self.__end = buffered
+    elif self.__start + length > capacity:
+      # Move the unread data to the front to make room.
+      self.__buffer[:buffered] = self.__buffer[self.__start:self.__end]
+      self.__start = 0
+      self.__end = buffered
+
+    view = memoryview(self.__buffer)
+    while self.__end - self.__start < length:
+      received = self.__sock.recv_into(view[self.__end:])
+
+      if received == 0:
+        # Client disconnected.
+        raise socket.error("Endpoint disconnected.")
+      self.__end += received
+    view.release()
 
 
-class MessagePasser:
+class SendQueue:
+  """ Collects outgoing data for a socket so that several messages can go out
+  in a single call. The queued buffers are passed to sendmsg as they are,
+  without being joined first. """
+
+  # Queued data is sent automatically once there is this much of it.
+  FLUSH_SIZE = 262144
+  # Largest number of buffers to pass to one sendmsg call.
+  _MAX_BUFFERS = 512
+
+  def __init__(self, sock, flush_size=FLUSH_SIZE):
+    """
+    Args:
+      sock: The socket to write to.
+      flush_size: How much data can be queued before it is sent
+                  automatically. """
+    self.__sock = sock
+    self.__flush_size = flush_size
+    self.__buffers = []
+    self.__queued = 0
+
+  def add(self, *buffers):
+    """ Queues some data to be sent.
+    Args:
+      buffers: The bytes-like objects to send, in order. They must not be
+               modified until they are sent. """
+    for data in buffers:
+      if len(data):
+        self.__buffers.append(data)
+        self.__queued += len(data)
+
+    if self.__queued >= self.__flush_size:
+      self.flush()
+
+  def flush(self):
+    """ Sends all the queued data. """
+    buffers = [memoryview(data) for data in self.__buffers]
+    self.__buffers = []
+    self.__queued = 0
+
+    if not hasattr(self.__sock, "sendmsg"):
+      # Not every platform has sendmsg.
+      self.__sock.sendall(b"".join(buffers))
+      return
+
+    while buffers:
+      sent = self.__sock.sendmsg(buffers[:self._MAX_BUFFERS])
+
+      # Drop the buffers that were sent completely, and the sent part of the
+      # next one.
+      done = 0
+      while done < len(buffers) and sent >= len(buffers[done]):
+        sent -= len(buffers[done])
+        done += 1
+      del buffers[:done]
+      if sent:
+        buffers[0] = buffers[0][sent:]
+
+
+class Framing:
+  """ Mixin with the framing, tracing and wire format switching that is
+  shared by MessagePasser and AsyncMessagePasser. Subclasses do the actual
+  reading and writing, and implement _peer_of(). """
+
+  # The wire format currently in use. Every connection starts out with JSON,
+  # and can switch once the handshake has picked a format.
+  _wire_format = wire_format.JSON
+  # How many bytes of each frame to include in wire traces. None means the
+  # whole frame.
+  _trace_preview = 256
+
+  # Length of the header of a JSON frame, which is the length of the body in
+  # decimal digits.
+  _JSON_HEADER_SIZE = 6
+
+  def _set_wire_format(self, new_format):
+    """ Sets the wire format to use for all future messages.
+    Args:
+      new_format: The name of the format, from wire_format. """
+    logger.debug("Using wire format %s.", new_format)
+    self._wire_format = new_format
+
+  def set_trace_preview(self, length):
+    """ Sets how much of each frame is shown in wire traces.
+    Args:
+      length: The number of bytes to show, or None to show whole frames. """
+    self._trace_preview = length
+
+  def _peer_of(self, stream):
+    """ Gets the address of the other end, for wire traces.
+    Args:
+      stream: The socket or stream that a frame was sent or received on.
+    Returns:
+      The address, or None if it is not known. """
+    raise NotImplementedError("_peer_of() must be implemented by subclass.")
+
+  def _trace(self, stream, action, frame):
+    """ Logs a frame to the wire logger. Callers should check _tracing() first,
+    so nothing is formatted when tracing is off.
+    Args:
+      stream: The socket or stream that the frame was sent or received on.
+      action: What happened to the frame, such as "sending".
+      frame: The frame, as a string or a bytes-like object. """
+    peer = self._peer_of(stream)
+
+    preview = frame
+    if self._trace_preview is not None and len(frame) > self._trace_preview:
+      preview = frame[:self._trace_preview]
+    if not isinstance(preview, str):
+      preview = bytes(preview)
+
+    wire_logger.debug("%s %s %d bytes: %r%s", peer, action, len(frame),
+                      preview, "..." if len(preview) < len(frame) else "",
+                      extra={"peer": peer})
+
+  def _header_size(self):
+    """
+    Returns:
+      The length of a frame header in the current wire format. """
+    if self._wire_format == wire_format.BINARY:
+      return wire_format.HEADER.size
+    return self._JSON_HEADER_SIZE
+
+  def _parse_header(self, header):
+    """ Parses a frame header, and checks the length in it.
+    Args:
+      header: The header, as a bytes-like object of _header_size() bytes.
+    Returns:
+      The type tag of the message, or None for JSON, and the length of the
+      body. """
+    if self._wire_format == wire_format.BINARY:
+      tag, length = wire_format.HEADER.unpack(header)
+      logger.debug("Reading binary message %d of length %d...", tag, length)
+    else:
+      tag = None
+      length = int(str(header, "ascii"))
+      logger.debug("Reading message of length %d...", length)
+
+    _check_length(length)
+    return tag, length
+
+  def _decode_frame(self, expected_type, stream, tag, body):
+    """ Deserializes the body of a frame.
+    Args:
+      expected_type: The class of the message that we expect to receive.
+      stream: The socket or stream that the frame was received on.
+      tag: The type tag from _parse_header().
+      body: The body of the frame, as a bytes-like object.
+    Returns:
+      The message. """
+    if self._wire_format == wire_format.BINARY:
+      if _tracing():
+        self._trace(stream, "received", body)
+      return expected_type.deserialize_binary_from(tag, body)
+
+    string_message = str(body, "utf-8")
+    if _tracing():
+      self._trace(stream, "received", string_message)
+    return expected_type.deserialize_from(string_message)
+
+  def _encode_frame(self, message, stream):
+    """ Serializes a message into a frame.
+    Args:
+      message: The message to serialize.
+      stream: The socket or stream that the frame will be sent on.
+    Returns:
+      The list of bytes-like objects to send, in order. """
+    if self._wire_format == wire_format.BINARY:
+      header, body = message.serialize_binary_parts()
+      logger.debug("Sending binary message of length %d.", len(body))
+      if _tracing():
+        self._trace(stream, "sending", body)
+      return [header, body]
+
+    string_message = message.serialize()
+    logger.debug("Sending message of length %d.", len(string_message))
+    if _tracing():
+      self._trace(stream, "sending", string_message)
+    return [string_message.encode("utf-8")]
+
+
+class MessagePasser(Framing):
   """ Superclass for things that send messages over a socket. """
 
+  def __init__(self):
+    # Receive buffers and send queues for each socket.
+    self.__buffers = weakref.WeakKeyDictionary()
+    self.__queues = weakref.WeakKeyDictionary()
+
+  def _peer_of(self, sock):
+    """ Gets the address of the other end, for wire traces.
+    Args:
+      sock: The socket that a frame was sent or received on.
+    Returns:
+      The address, or None if the socket is not connected. """
+    try:
+      return sock.getpeername()
+    except socket.error:
+      return None
+
+  def _receive_buffer(self, sock):
+    """ Gets the receive buffer for a socket, creating it if needed.
+    Args:
+      sock: The socket to get the buffer for.
+    Returns:
+      The ReceiveBuffer. """
+    receive_buffer = self.__buffers.get(sock)
+    if receive_buffer is None:
+      receive_buffer = ReceiveBuffer(sock)
+      self.__buffers[sock] = receive_buffer
+    return receive_buffer
+
+  def _send_queue(self, sock):
+    """ Gets the send queue for a socket, creating it if needed.
+    Args:
+      sock: The socket to get the queue for.
+    Returns:
+      The SendQueue. """
+    send_queue = self.__queues.get(sock)
+    if send_queue is None:
+      send_queue = SendQueue(sock)
+      self.__queues[sock] = send_queue
+    return send_queue
+
+  def _flush(self, sock):
+    """ Sends all the messages that are queued for a socket.
+    Args:
+      sock: The socket to flush. """
+    self._send_queue(sock).flush()
+
   def _read_length(self, sock, length):
     """ Reads an entire length of data.
     Args:
@@ -15,18 +338,7 @@ class MessagePasser:
       length: The length of the message to read.
     Returns:
       The data that it read. """
-    remaining = length
-    data = ""
-    while remaining > 0:
-      data_this_round = sock.recv(remaining).decode("utf-8")
-      remaining -= len(data_this_round)
-      data += data_this_round
-
-      if len(data_this_round) == 0:
-        # Client disconnected.
-        raise socket.error("Endpoint disconnected.")
-
-    return data
+    return str(self._receive_buffer(sock).read(length), "utf-8")
 
   def _read_message(self, expected_type, sock):
     """ Waits for and reads the next message from the socket.
@@ -35,25 +347,23 @@ class MessagePasser:
       sock: The socket to read from.
     Returns:
       The message that it read. """
-    # Read the length first.
-    length = int(self._read_length(sock, 6))
-    logger.debug("Reading message of length %d..." % (length))
+    receive_buffer = self._receive_buffer(sock)
 
-    # Read the actual message.
-    string_message = self._read_length(sock, length)
-    logger.debug("Got new message: %s" % (string_message))
+    # Read the header first, and then the body.
+    tag, length = self._parse_header(receive_buffer.read(self._header_size()))
+    body = receive_buffer.read(length)
+    return self._decode_frame(expected_type, sock, tag, body)
 
-    # Deserialize it.
-    return expected_type.deserialize_from(string_message)
-
-  def _write_message(self, message, sock):
+  def _write_message(self, message, sock, flush=True):
     """ Writes a message to the socket.
     Args:
       message: The message to write.
-      sock: The socket to write to. """
-    # Serialize the message.
-    string_message = message.serialize()
-    logger.debug("Sending message: %s" % (string_message))
+      sock: The socket to write to.
+      flush: If false, the message is only queued. It is then sent along with
+             later messages, once enough of them are queued or _flush() is
+             called. """
+    send_queue = self._send_queue(sock)
+    send_queue.add(*self._encode_frame(message, sock))
 
-    # Send it.
-    sock.sendall(string_message.encode("utf-8"))
+    if flush:
+      send_queue.flush()
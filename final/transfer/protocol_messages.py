@@ -19,12 +19,20 @@ class _ProtocolMessage(message.Message):
 class ClientHello(_ProtocolMessage):
   """ A ClientHello message. """
 
+  TYPE_TAG = 1
+
   @classmethod
   def create(cls, **kwargs):
     """
     This message supports the following parameters:
       pkc: List of PKC algorithms supported by the client.
       symmetric: List of symmetric algorithms supported by the client.
+      formats: List of wire formats supported by the client. (optional)
+      resumption: True if the client would like a session ticket. (optional)
+      ticket: ID of the session ticket to resume with. (optional)
+      client_nonce: Random string for this resumption. Required with ticket.
+      proof: Proof that the client has the ticket, from
+             Ticket.client_proof(). Required with ticket.
     Returns:
       The created message. """
     pkc = kwargs["pkc"]
@@ -32,19 +40,44 @@ class ClientHello(_ProtocolMessage):
 
     message = cls()
     message._raw = {"pkc": pkc, "symmetric": symmetric}
+    if "formats" in kwargs:
+      message._raw["formats"] = kwargs["formats"]
+    if "resumption" in kwargs:
+      message._raw["resumption"] = kwargs["resumption"]
+
+    if "ticket" in kwargs:
+      # Nothing is encrypted, since there are no fresh keys yet.
+      message._raw["ticket"] = kwargs["ticket"]
+      message._raw["client_nonce"] = kwargs["client_nonce"]
+      message._raw["proof"] = kwargs["proof"]
 
     return message
 
 class ServerHello(_ProtocolMessage):
   """ A ServerHello message. """
 
+  TYPE_TAG = 2
+
   @classmethod
-  def create(cls, **kwargs):
+  def create(cls, session_context=None, **kwargs):
     """
+    Args:
+      session_context: SecureContext for the key of the resumed session.
+                       Only needed when resuming.
     This messsage supports the following parameters:
       pkc: The name of the PCK algorithm that we want to use.
       symmetric: The name of the symmetric algorithm that we want to use.
       pub_key: The client's public key.
+      format: The wire format to use after this message. (optional)
+      resumed: True if the session is resumed from the client's ticket, in
+               which case the rest of the handshake is skipped. (optional)
+      server_nonce: Random string for this resumption. Required when resumed.
+      proof: Proof that the server has the ticket, from
+             Ticket.server_proof(). Required when resumed.
+      ticket: ID of a new session ticket. Only sent when resumed.
+              (encrypted, optional)
+      ticket_lifetime: How many seconds the ticket can be used for. Required
+                       with ticket. (optional)
     Returns:
       The created message. """
     pkc = kwargs["pkc"]
@@ -53,12 +86,27 @@ class ServerHello(_ProtocolMessage):
 
     message = cls()
     message._raw = {"pkc": pkc, "symmetric": symmetric, "pub_key": pub_key}
+    if "format" in kwargs:
+      message._raw["format"] = kwargs["format"]
+
+    if kwargs.get("resumed", False):
+      message._raw["resumed"] = True
+      message._raw["server_nonce"] = kwargs["server_nonce"]
+      message._raw["proof"] = kwargs["proof"]
+      if "ticket" in kwargs:
+        # Update the nonce before encrypting fields.
+        session_context.update_nonce()
+
+        message._raw["ticket"] = session_context.encrypt(kwargs["ticket"])
+        message._raw["ticket_lifetime"] = kwargs["ticket_lifetime"]
 
     return message
 
 class ClientChallenge(_ProtocolMessage):
   """ A ClientChallenge message. """
 
+  TYPE_TAG = 3
+
   @classmethod
   def create(cls, server_pub_context, **kwargs):
     """
@@ -93,6 +141,8 @@ class ClientChallenge(_ProtocolMessage):
 class ServerChallenge(_ProtocolMessage):
   """ A ServerChallenge message. """
 
+  TYPE_TAG = 4
+
   @classmethod
   def create(cls, client_pub_context, session_context, **kwargs):
     """
@@ -102,6 +152,9 @@ class ServerChallenge(_ProtocolMessage):
     This message supports the following parameters:
       challenge: Random string to use as challenge. (encrypted)
       response: The response value to send back to the client. (encrypted)
+      ticket: ID of a session ticket for the client. (encrypted, optional)
+      ticket_lifetime: How many seconds the ticket can be used for. Required
+                       with ticket. (optional)
     Returns:
       The created message. """
     plain_challenge = kwargs["challenge"]
@@ -116,12 +169,17 @@ class ServerChallenge(_ProtocolMessage):
 
     message = cls()
     message._raw = {"challenge": challenge, "response": response}
+    if "ticket" in kwargs:
+      message._raw["ticket"] = session_context.encrypt(kwargs["ticket"])
+      message._raw["ticket_lifetime"] = kwargs["ticket_lifetime"]
 
     return message
 
 class ClientSessionVerify(_ProtocolMessage):
   """ A ClientSessionVerify message. """
 
+  TYPE_TAG = 5
+
   @classmethod
   def create(cls, session_context, **kwargs):
     """
@@ -148,13 +206,17 @@ class SessionMessage(_ProtocolMessage):
   """ A standard encrypted message that is send back and forth during the
   session. """
 
+  TYPE_TAG = 6
+
   @classmethod
   def create(cls, session_context, **kwargs):
     """
     Args:
       session_context: SecureContext for the session key.
     This message supports the following parameters:
-      contents: Arbitrary data to send to the client. (encrypted) """
+      contents: Arbitrary data to send to the client. (encrypted)
+      fragment: Header from fragments.format_header(), if the contents are one
+                fragment of a larger message. (encrypted, optional) """
     plain_contents = kwargs["contents"]
 
     # Update the nonce before encrypting fields.
@@ -165,5 +227,9 @@ class SessionMessage(_ProtocolMessage):
 
     message = cls()
     message._raw = {"contents": contents}
+    if "fragment" in kwargs:
+      # The header is encrypted too, so fragments can't be reordered or
+      # dropped without the receiver noticing.
+      message._raw["fragment"] = session_context.encrypt(kwargs["fragment"])
 
     return message
@@ -1,42 +1,90 @@
+import concurrent.futures
 import logging
+import os
 import secrets
+import signal
 import socket
+import threading
+import time
 
+from . import fragments
 from . import message_passer
 from . import protocol_messages as messages
+from . import wire_format
 
 
 logger = logging.getLogger(__name__)
 
+# Workers that exit sooner than this after starting are restarted only after
+# this many seconds, so that a worker that fails straight away doesn't spin.
+_RESTART_DELAY = 1.0
 
-class Server(message_passer.MessagePasser):
-  """ This class handles the main server functionality. """
 
-  def __init__(self, port, crypto_manager):
+class ClientConnection(message_passer.MessagePasser):
+  """ Handles a single client, from the handshake until it disconnects. All the
+  state for the session lives here, so that several clients can be served at
+  the same time. """
+
+  def __init__(self, server, client_sock, crypto_manager, wire_formats,
+               ticket_cache=None):
     """
     Args:
-      port: The port to listen on.
-      crypto_manager: The CryptoManager instance to use. """
+      server: The Server that accepted the connection.
+      client_sock: Socket that we use to communicate with the client.
+      crypto_manager: The CryptoManager to use for this client only.
+      wire_formats: The wire formats that the server is willing to use.
+      ticket_cache: The TicketCache to issue and redeem session tickets with,
+                    or None to always perform the full handshake. """
+    super().__init__()
+
+    self.__server = server
+    self.__socket = client_sock
     self.__manager = crypto_manager
+    self.__wire_formats = wire_formats
+    self.__tickets = ticket_cache
+    # Collects fragmented messages from this client.
+    self.__reassembler = fragments.Reassembler()
 
-    # Create the socket.
-    self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    self.__socket.bind(("", port))
-    self.__socket.listen(5)
+  def run(self):
+    """ Performs the handshake, and then services all the client's requests
+    until it disconnects. """
+    try:
+      # Perform the handshake. Every connection starts out with JSON.
+      self._set_wire_format(wire_format.JSON)
+      self.__handshake_with(self.__socket)
 
-    logger.info("Server listening on port %d." % (port))
+      # Receive messages.
+      while True:
+        try:
+          self.__receive_message(self.__socket)
+        except socket.error:
+          logger.info("Client disconnected.")
+          # Drop any message that was cut off.
+          self.__reassembler.reset()
+          break
+        except ValueError as error:
+          # The client sent something that can't be a valid message, such as
+          # a bad fragment header. There is no way to resynchronize, so drop
+          # it.
+          logger.warning("Dropping client after invalid message: %s", error)
+          self.__reassembler.reset()
+          break
+    finally:
+      # Stop anything the session's ciphers are running in the background.
+      self.__manager.close()
 
-  def __handle_challenge(self, client_sock):
+  def __handle_challenge(self, client_sock, issue_ticket):
     """ Handles the challenge from the client.
     Args:
-      client_sock: Socket that we use to communicate with the client. """
+      client_sock: Socket that we use to communicate with the client.
+      issue_ticket: True to give the client a session ticket. """
     # Wait for the challenge message.
     challenge_message = self._read_message(messages.ClientChallenge,
                                            client_sock)
 
     # Create a new context for the client PKC.
     client_key = challenge_message.get("pub_key")
-    logger.debug("Got client public key: %s" % (client_key))
+    logger.debug("Got client public key: %s", client_key)
     server_pub_context, server_priv_context = self.__manager.get_pkc()
     client_pub_context = server_pub_context.copy_with_key(client_key)
 
@@ -59,10 +107,21 @@ class Server(message_passer.MessagePasser):
     # This one is not in the manager, and so has to be set manually.
     client_pub_context.set_mac_key(mac_key)
 
+    # Create a ticket for the client. It can't be used until the client has
+    # passed the challenge.
+    ticket = None
+    ticket_fields = {}
+    if issue_ticket:
+      ticket = self.__tickets.new_ticket(server_pub_context.get_name(),
+                                         symmetric_context.get_name(),
+                                         session_key, mac_key)
+      ticket_fields = {"ticket": ticket.ticket_id,
+                       "ticket_lifetime": self.__tickets.get_lifetime()}
+
     # Create the response message.
     response_message = messages.ServerChallenge.create( \
         client_pub_context, symmetric_context,
-        response=response, challenge=client_challenge)
+        response=response, challenge=client_challenge, **ticket_fields)
     # Send the message.
     self._write_message(response_message, client_sock)
 
@@ -79,6 +138,70 @@ class Server(message_passer.MessagePasser):
                          (client_challenge, client_response))
     logger.debug("Client challenge passed.")
 
+    if ticket is not None:
+      self.__tickets.add(ticket)
+
+  def __resume(self, client_sock, client_hello):
+    """ Resumes a session from the ticket in a ClientHello, if there is one
+    and it is still valid.
+    Args:
+      client_sock: The socket for the client.
+      client_hello: The ClientHello from the client.
+    Returns:
+      True if the session was resumed, or false if the full handshake has to
+      be performed. """
+    ticket_id = client_hello.get("ticket", None)
+    if ticket_id is None or self.__tickets is None:
+      return False
+
+    ticket = self.__tickets.redeem(ticket_id)
+    if ticket is None:
+      logger.debug("Ticket %s is unknown or expired.", ticket_id)
+      return False
+    if ticket.pkc not in self.__manager.get_supported_pkcs() or \
+       ticket.symmetric not in self.__manager.get_supported_symmetric():
+      return False
+
+    # The ticket has already been used up, so a client that can't prove that
+    # it has it doesn't get another try.
+    client_nonce = client_hello.get("client_nonce")
+    if not ticket.check_client_proof(client_nonce, client_hello.get("proof")):
+      raise RuntimeError("Client could not prove that it has the ticket.")
+
+    # The keys of the old session are never used again. Instead, both sides
+    # derive new ones from the ticket and a nonce from each side, so a
+    # continuous keystream never repeats.
+    server_nonce = secrets.token_hex(32)
+    session_key, mac_key = ticket.derive_keys(client_nonce, server_nonce)
+    self.__manager.set_algorithms(ticket.pkc, ticket.symmetric)
+    symmetric_context = self.__manager.get_symmetric()
+    symmetric_context.set_key(session_key)
+    self.__manager.set_mac_keys(mac_key)
+
+    # Create the next ticket.
+    new_ticket = self.__tickets.new_ticket(ticket.pkc, ticket.symmetric,
+                                           session_key, mac_key)
+
+    # Send the ServerHello message. The new ticket is the first thing that is
+    # encrypted with the new keys.
+    server_public, _ = self.__manager.get_pkc()
+    chosen_format = wire_format.choose(client_hello.get("formats", []),
+                                       self.__wire_formats)
+    server_hello = messages.ServerHello.create(symmetric_context,
+        pkc=ticket.pkc, symmetric=ticket.symmetric,
+        pub_key=server_public.get_key(), format=chosen_format, resumed=True,
+        server_nonce=server_nonce,
+        proof=ticket.server_proof(client_nonce, server_nonce),
+        ticket=new_ticket.ticket_id,
+        ticket_lifetime=self.__tickets.get_lifetime())
+    self._write_message(server_hello, client_sock)
+
+    self.__tickets.add(new_ticket)
+    # Everything after the ServerHello uses the chosen format.
+    self._set_wire_format(chosen_format)
+
+    return True
+
   def __handshake_with(self, client_sock):
     """ Performs the handshake with a client.
     Args:
@@ -86,6 +209,11 @@ class Server(message_passer.MessagePasser):
     # Wait for a ClientHello message.
     client_hello = self._read_message(messages.ClientHello, client_sock)
 
+    # Skip the rest of the handshake if the client has a valid ticket.
+    if self.__resume(client_sock, client_hello):
+      logger.info("Session resumed from ticket.")
+      return
+
     # Determine what cryptosystems to use.UCSD SoP
     client_pkcs = client_hello.get("pkc")
     client_symmetric = client_hello.get("symmetric")
@@ -100,13 +228,21 @@ class Server(message_passer.MessagePasser):
     pkc_name = server_public.get_name()
     symmetric_name = server_symmetric.get_name()
     server_pub_key = server_public.get_key()
+    # Clients that don't offer any formats only understand JSON.
+    chosen_format = wire_format.choose(client_hello.get("formats", []),
+                                       self.__wire_formats)
     server_hello = messages.ServerHello.create(pkc=pkc_name,
                                                symmetric=symmetric_name,
-                                               pub_key=server_pub_key)
+                                               pub_key=server_pub_key,
+                                               format=chosen_format)
     self._write_message(server_hello, client_sock)
+    # Everything after the ServerHello uses the chosen format.
+    self._set_wire_format(chosen_format)
 
     # Handle the challenge from the client.
-    self.__handle_challenge(client_sock)
+    issue_ticket = self.__tickets is not None and \
+                   client_hello.get("resumption", False)
+    self.__handle_challenge(client_sock, issue_ticket)
 
     logger.info("Session successfully initialized.")
 
@@ -121,22 +257,221 @@ class Server(message_passer.MessagePasser):
     symmetric_context = self.__manager.get_symmetric()
     contents = message.get_encrypted("contents", symmetric_context)
 
-    logger.info("Got message: %s" % (contents))
+    if message.get("fragment", None) is None:
+      if self.__reassembler.in_progress():
+        self.__reassembler.reset()
+        raise ValueError("Got a message in the middle of a fragmented one.")
+
+      logger.info("Got message: %s", contents)
+      return
+
+    # This is one fragment of a larger message.
+    header = message.get_encrypted("fragment", symmetric_context)
+    index, total = fragments.parse_header(header)
+    logger.debug("Got fragment %d of %d.", index + 1, total)
+
+    complete = self.__reassembler.add(index, total, contents)
+    if complete is not None:
+      length, message_file = complete
+      with message_file:
+        self.__server._handle_large_message(length, message_file)
+
+class Server(message_passer.MessagePasser):
+  """ This class handles the main server functionality. """
+
+  def __init__(self, port, crypto_manager, wire_formats=wire_format.SUPPORTED,
+               ticket_cache=None):
+    """
+    Args:
+      port: The port to listen on.
+      crypto_manager: The CryptoManager instance to use. When serving several
+                      clients at once, each one gets its own fork of it.
+      wire_formats: The wire formats that the server is willing to use.
+      ticket_cache: The TicketCache that remembers the session tickets issued
+                    to clients, or None to not issue any. Workers started by
+                    serve_forked() each get their own copy, so a client that
+                    reconnects to a different worker gets a full handshake.
+    """
+    super().__init__()
+
+    self.__manager = crypto_manager
+    self.__wire_formats = wire_formats
+    self.__tickets = ticket_cache
+    self.__running = False
+    # Maps the PIDs of worker processes to the times they were started.
+    self.__workers = {}
+
+    # Create the socket.
+    self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.__socket.bind(("", port))
+    self.__socket.listen(5)
+
+    logger.info("Server listening on port %d.", port)
+
+  def _handle_large_message(self, length, message_file):
+    """ Called when all the fragments of a large message have been received.
+    Args:
+      length: The length of the message.
+      message_file: A binary file object to read the message from. It is
+                    closed once this returns. """
+    logger.info("Got message of length %d.", length)
+
+  def __connection(self, client_sock, crypto_manager):
+    """ Creates the object that handles a client.
+    Args:
+      client_sock: The socket for the client.
+      crypto_manager: The CryptoManager to use for the client.
+    Returns:
+      The ClientConnection. """
+    connection = ClientConnection(self, client_sock, crypto_manager,
+                                  self.__wire_formats, self.__tickets)
+    connection.set_trace_preview(self._trace_preview)
+    return connection
 
   def handle_client(self):
     """ Waits for a client to connect, services all the client's requests, and
     then returns when the client disconnects. """
     # First, accept a connection.
     client_sock, addr = self.__socket.accept()
-    logger.info("Got connection from %s." % (str(addr)))
-
-    # Perform the handshake.
-    self.__handshake_with(client_sock)
-
-    # Receive messages.
-    while True:
-      try:
-        self.__receive_message(client_sock)
-      except socket.error:
-        logger.info("Client disconnected.")
-        break
+    logger.info("Got connection from %s.", addr)
+
+    with client_sock:
+      self.__connection(client_sock, self.__manager).run()
+
+  def serve_forever(self, max_clients):
+    """ Serves any number of clients, several at a time, until shutdown() is
+    called. A client that fails does not affect any of the others.
+    Args:
+      max_clients: How many clients to serve at the same time. Clients that
+                   connect while this many are being served wait their turn.
+    """
+    self.__running = True
+    # Clients are only accepted while there is a free thread to serve them.
+    # The rest wait in the listen backlog, so that when several workers share
+    # the socket, an idle one can take them.
+    free_slots = threading.BoundedSemaphore(max_clients)
+    with concurrent.futures.ThreadPoolExecutor(max_clients) as pool:
+      while self.__running:
+        free_slots.acquire()
+        try:
+          client_sock, addr = self.__socket.accept()
+        except socket.error:
+          free_slots.release()
+          if not self.__running:
+            # The socket was closed by shutdown().
+            break
+          raise
+
+        logger.info("Got connection from %s.", addr)
+        pool.submit(self.__serve, client_sock, addr, free_slots)
+
+  def serve_forked(self, workers, make_manager=None, max_clients=1):
+    """ Serves clients on several worker processes, which all accept
+    connections on the same listening socket. Each worker has its own
+    interpreter, so the cryptography can use as many cores as there are
+    workers. This process supervises them, and restarts any that exit, until
+    shutdown() is called. Only works where os.fork() is available.
+    Args:
+      workers: The number of worker processes.
+      make_manager: Called in each worker to create its CryptoManager, or None
+                    to use this server's.
+      max_clients: How many clients each worker serves at the same time. """
+    self.__running = True
+    for _ in range(workers):
+      self.__start_worker(make_manager, max_clients)
+
+    try:
+      while self.__workers:
+        try:
+          pid, status = os.wait()
+        except ChildProcessError:
+          break
+
+        started = self.__workers.pop(pid, None)
+        if started is None or not self.__running:
+          continue
+
+        logger.warning("Worker %d exited with status %d, restarting it.", pid,
+                       os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < _RESTART_DELAY:
+          time.sleep(_RESTART_DELAY)
+        self.__start_worker(make_manager, max_clients)
+    finally:
+      self.shutdown()
+      for pid in list(self.__workers):
+        try:
+          os.waitpid(pid, 0)
+        except ChildProcessError:
+          pass
+      self.__workers.clear()
+
+  def shutdown(self):
+    """ Stops serve_forever() from accepting any more clients. Clients that
+    are already connected are served until they disconnect. When called on
+    the process running serve_forked(), the workers are stopped instead, and
+    any clients that they are serving get disconnected. """
+    self.__running = False
+
+    if self.__workers:
+      for pid in self.__workers:
+        try:
+          os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+          pass
+      # The workers share the listening socket, so it is only closed here,
+      # rather than shut down for all of them.
+      self.__socket.close()
+      return
+
+    try:
+      # This wakes up the accept() call. Closing alone doesn't on every
+      # platform.
+      self.__socket.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+      pass
+    self.__socket.close()
+
+  def __start_worker(self, make_manager, max_clients):
+    """ Forks a worker process, which serves clients until it is killed.
+    Args:
+      make_manager: Creates the worker's CryptoManager, or None.
+      max_clients: How many clients the worker serves at the same time. """
+    pid = os.fork()
+    if pid:
+      # This is the supervisor.
+      self.__workers[pid] = time.monotonic()
+      logger.info("Started worker %d.", pid)
+      return
+
+    # This is the worker. It must never return to the caller.
+    status = 0
+    try:
+      self.__workers = {}
+      if make_manager is not None:
+        self.__manager = make_manager()
+      self.serve_forever(max_clients)
+    except KeyboardInterrupt:
+      pass
+    except Exception:
+      logger.exception("Worker %d failed.", os.getpid())
+      status = 1
+    finally:
+      logging.shutdown()
+      os._exit(status)
+
+  def __serve(self, client_sock, addr, free_slots):
+    """ Serves a single client on a worker thread.
+    Args:
+      client_sock: The socket for the client.
+      addr: The address of the client.
+      free_slots: The semaphore that was acquired for the client. It is
+                  released once the client is done. """
+    try:
+      with client_sock:
+        # Each client gets its own keys, nonces, and MAC state.
+        crypto_manager = self.__manager.fork_session()
+        self.__connection(client_sock, crypto_manager).run()
+    except Exception:
+      logger.exception("Error while serving %s.", addr)
+    finally:
+      free_slots.release()
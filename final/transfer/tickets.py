@@ -0,0 +1,258 @@
+""" Session tickets, which let a client reconnect without going through the
+public key part of the handshake again.
+
+After a full handshake, the server gives the client a random ticket ID. Both
+sides derive a resumption secret from the keys of the session, and keep it
+along with the algorithms, in a Ticket. The server keeps its tickets in a
+TicketCache. The keys themselves are never used again once the session ends.
+
+To resume, the client sends the ID in its ClientHello, along with a fresh
+nonce and a MAC over both with the secret, which shows that it really has the
+ticket. If the server still has the ticket, it answers with a resumed
+ServerHello, which carries its own fresh nonce and a MAC that proves that it
+has the secret too. Both sides then derive the keys for the new session from
+the secret and the two nonces, and the session starts straight away. The new
+ticket in the ServerHello is the first thing encrypted with them. If the
+server doesn't have the ticket, the handshake goes on as normal.
+
+Every ticket can only be used once. """
+
+import collections
+import hmac
+import secrets
+import threading
+import time
+
+from final.crypto import HMAC
+
+
+# Default number of tickets that a server remembers.
+CAPACITY = 1024
+# Default number of seconds that a ticket can be used for.
+LIFETIME = 3600
+# Number of bytes in the MAC keys derived for resumed sessions. The full
+# handshake uses the same size.
+_MAC_KEY_LENGTH = 40
+
+
+def _derive(secret, label, length):
+  """ Derives key material from a secret, by chaining HMACs over a label in
+  the same way as the expand step of HKDF.
+  Args:
+    secret: The secret, as a string.
+    label: What the key material is for. Different labels give unrelated
+           key material.
+    length: The number of bytes to derive.
+  Returns:
+    The key material, as a string. """
+  output = ""
+  block = ""
+  counter = 1
+  while len(output) < length:
+    block = HMAC.Hmac(secret, "%s%s%c" % (block, label, counter))
+    output += block
+    counter += 1
+  return output[:length]
+
+def _matches(expected, proof):
+  """ Checks a proof from the other side, in constant time.
+  Args:
+    expected: The correct proof.
+    proof: The proof that was received. It may be of any type.
+  Returns:
+    True if they are the same. """
+  if not isinstance(proof, str):
+    return False
+  return hmac.compare_digest(expected.encode("utf-8"), proof.encode("utf-8"))
+
+
+class Ticket:
+  """ Everything needed to resume a session. """
+
+  def __init__(self, ticket_id, pkc, symmetric, session_key, mac_key,
+               lifetime):
+    """
+    Args:
+      ticket_id: The ID that the server knows the ticket by.
+      pkc: The name of the PKC that the session used.
+      symmetric: The name of the symmetric algorithm that the session used.
+      session_key: The session key. Only a secret derived from it is kept.
+      mac_key: The MAC key. Only a secret derived from it is kept.
+      lifetime: How many seconds from now the ticket can be used for. """
+    self.ticket_id = ticket_id
+    self.pkc = pkc
+    self.symmetric = symmetric
+    self.secret = _derive(session_key + mac_key, "resumption", 20)
+    # Resumed sessions get keys of the same size.
+    self.key_length = len(session_key)
+    self.expires = time.monotonic() + lifetime
+
+  def expired(self):
+    """
+    Returns:
+      True if the ticket can no longer be used. """
+    return time.monotonic() >= self.expires
+
+  def client_proof(self, client_nonce):
+    """ Creates the proof that the client has this ticket.
+    Args:
+      client_nonce: The client's nonce for the resumption.
+    Returns:
+      The proof, as a hex string. """
+    label = "client proof %s %s" % (self.ticket_id, client_nonce)
+    return HMAC.Hmac(self.secret, label).encode("latin-1").hex()
+
+  def server_proof(self, client_nonce, server_nonce):
+    """ Creates the proof that the server has this ticket.
+    Args:
+      client_nonce: The client's nonce for the resumption.
+      server_nonce: The server's nonce for the resumption.
+    Returns:
+      The proof, as a hex string. """
+    label = "server proof %s %s %s" % (self.ticket_id, client_nonce,
+                                       server_nonce)
+    return HMAC.Hmac(self.secret, label).encode("latin-1").hex()
+
+  def check_client_proof(self, client_nonce, proof):
+    """
+    Args:
+      client_nonce: The client's nonce for the resumption.
+      proof: The proof from the client.
+    Returns:
+      True if the proof is valid. """
+    return _matches(self.client_proof(client_nonce), proof)
+
+  def check_server_proof(self, client_nonce, server_nonce, proof):
+    """
+    Args:
+      client_nonce: The client's nonce for the resumption.
+      server_nonce: The server's nonce for the resumption.
+      proof: The proof from the server.
+    Returns:
+      True if the proof is valid. """
+    return _matches(self.server_proof(client_nonce, server_nonce), proof)
+
+  def derive_keys(self, client_nonce, server_nonce):
+    """ Derives the keys for a session resumed from this ticket. Both sides
+    pick a nonce, so the keys are fresh as long as either of them does.
+    Args:
+      client_nonce: The client's nonce for the resumption.
+      server_nonce: The server's nonce for the resumption.
+    Returns:
+      The session key and the MAC key. """
+    label = "keys %s %s" % (client_nonce, server_nonce)
+    keys = _derive(self.secret, label, self.key_length + _MAC_KEY_LENGTH)
+    mac_key = keys[self.key_length:].encode("latin-1").hex()
+    return keys[:self.key_length], mac_key
+
+class TicketCache:
+  """ Remembers the tickets that a server has issued. It is bounded, so once it
+  is full, issuing a ticket forgets the oldest one. It can be shared by
+  several connections at once. """
+
+  def __init__(self, capacity=CAPACITY, lifetime=LIFETIME):
+    """
+    Args:
+      capacity: The most tickets to remember.
+      lifetime: How many seconds each ticket can be used for. """
+    self.__capacity = capacity
+    self.__lifetime = lifetime
+    # Maps ticket IDs to tickets, oldest first.
+    self.__tickets = collections.OrderedDict()
+    self.__lock = threading.Lock()
+
+  def __len__(self):
+    with self.__lock:
+      return len(self.__tickets)
+
+  def get_lifetime(self):
+    """
+    Returns:
+      How many seconds each ticket can be used for. """
+    return self.__lifetime
+
+  def new_ticket(self, pkc, symmetric, session_key, mac_key):
+    """ Creates a ticket with a new random ID. It can't be redeemed until it is
+    added with add().
+    Args:
+      pkc: The name of the PKC that the session uses.
+      symmetric: The name of the symmetric algorithm that the session uses.
+      session_key: The session key.
+      mac_key: The MAC key.
+    Returns:
+      The ticket. """
+    return Ticket(secrets.token_hex(16), pkc, symmetric, session_key, mac_key,
+                  self.__lifetime)
+
+  def add(self, ticket):
+    """ Remembers a ticket, so that it can be redeemed.
+    Args:
+      ticket: The ticket, from new_ticket(). """
+    with self.__lock:
+      self.__tickets[ticket.ticket_id] = ticket
+      # Tickets are added in the order they expire, so expired ones are
+      # always at the front.
+      while self.__tickets:
+        _, oldest = next(iter(self.__tickets.items()))
+        if len(self.__tickets) <= self.__capacity and not oldest.expired():
+          break
+        self.__tickets.popitem(last=False)
+
+  def redeem(self, ticket_id):
+    """ Looks up a ticket, and forgets it so that it can't be used again.
+    Args:
+      ticket_id: The ID of the ticket.
+    Returns:
+      The ticket, or None if there is no such ticket or it expired. """
+    with self.__lock:
+      ticket = self.__tickets.pop(ticket_id, None)
+
+    if ticket is None or ticket.expired():
+      return None
+    return ticket
+
+
+if __name__ == "__main__":
+  from final.crypto import RC4
+
+  def keystream(key):
+    """ Gets the start of the continuous RC4 keystream for a key. """
+    cipher = RC4.RC4(256, 768, True)
+    cipher.set_key(key)
+    return cipher.encrypt_bytes(bytes(4096))
+
+  def windows(stream):
+    """ Gets every 16 byte window of a keystream. """
+    return {stream[i:i + 16] for i in range(len(stream) - 15)}
+
+  # The client and the server each build the ticket from the keys of the
+  # full handshake.
+  session_key = RC4.RC4(256).gen_key()
+  mac_key = secrets.token_hex(40)
+  ticket_id = secrets.token_hex(16)
+  client_ticket = Ticket(ticket_id, "RSA", "RC4", session_key, mac_key, 60)
+  server_ticket = Ticket(ticket_id, "RSA", "RC4", session_key, mac_key, 60)
+
+  client_nonce = secrets.token_hex(32)
+  server_nonce = secrets.token_hex(32)
+  proof = client_ticket.client_proof(client_nonce)
+  assert server_ticket.check_client_proof(client_nonce, proof)
+  assert not server_ticket.check_client_proof(secrets.token_hex(32), proof)
+  assert not server_ticket.check_client_proof(client_nonce, None)
+  proof = server_ticket.server_proof(client_nonce, server_nonce)
+  assert client_ticket.check_server_proof(client_nonce, server_nonce, proof)
+
+  # Both sides get the same new keys, which share no keystream with the old
+  # ones, or with those of another resumption from the same client nonce.
+  keys = client_ticket.derive_keys(client_nonce, server_nonce)
+  assert keys == server_ticket.derive_keys(client_nonce, server_nonce)
+  resumed_key, resumed_mac_key = keys
+  assert len(resumed_key) == len(session_key)
+  assert len(resumed_mac_key) == len(mac_key)
+  other_key, _ = client_ticket.derive_keys(client_nonce, secrets.token_hex(32))
+
+  old = windows(keystream(session_key))
+  resumed = windows(keystream(resumed_key))
+  other = windows(keystream(other_key))
+  assert not old & resumed and not old & other and not resumed & other
+  print("Resumed sessions share no keystream.")
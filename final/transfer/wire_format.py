@@ -0,0 +1,244 @@
+""" Wire formats that messages can be serialized with. JSON is always
+supported, and is what the handshake starts with. The binary format is a
+compact alternative that the client and server can agree on in ClientHello and
+ServerHello.
+
+A binary frame is laid out as follows:
+  - One byte with the type tag of the message.
+  - Four bytes with the length of the body, as a big-endian uint32.
+  - The body, which is the raw message dict encoded with pack().
+
+Every value in the body starts with a one-byte tag, followed by:
+  - Nothing, for None, False and True.
+  - A varint byte count and the big-endian two's complement bytes, for ints.
+  - A varint length and the bytes, for strings and bytes. Strings are stored
+    as latin-1 where possible, so encrypted fields are sent as raw bytes.
+  - A varint count and the items, for lists.
+  - A varint count and alternating keys and values, for dicts. """
+
+import struct
+
+
+# Names of the wire formats.
+JSON = "json"
+BINARY = "binary"
+# All supported formats, in order of preference.
+SUPPORTED = [BINARY, JSON]
+
+# Binary frame header: the type tag and the body length.
+HEADER = struct.Struct(">BI")
+# How deeply lists and dicts can be nested in a body. Messages only ever use a
+# couple of levels, so anything deeper is rejected before it can exhaust the
+# stack.
+MAX_DEPTH = 32
+
+# Value tags used in the binary body.
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_LATIN1 = 4
+_UTF8 = 5
+_BYTES = 6
+_LIST = 7
+_DICT = 8
+
+
+def choose(offered, supported=SUPPORTED):
+  """ Picks the wire format to use for a connection.
+  Args:
+    offered: The formats offered by the other side, in order of preference.
+    supported: The formats supported by this side.
+  Returns:
+    The first offered format that is also supported, or JSON if there is
+    none. """
+  for wire_format in offered:
+    if wire_format in supported:
+      return wire_format
+  return JSON
+
+def _pack_varint(out, value):
+  """ Appends an unsigned LEB128 varint.
+  Args:
+    out: The bytearray to append to.
+    value: The non-negative int to append. """
+  while value > 0x7f:
+    out.append((value & 0x7f) | 0x80)
+    value >>= 7
+  out.append(value)
+
+def _unpack_varint(data, offset):
+  """ Reads an unsigned LEB128 varint.
+  Args:
+    data: The data to read from.
+    offset: The offset of the varint.
+  Returns:
+    The value, and the offset just after it. """
+  value = 0
+  shift = 0
+  while True:
+    byte = data[offset]
+    offset += 1
+    value |= (byte & 0x7f) << shift
+    if byte < 0x80:
+      return value, offset
+    shift += 7
+
+def _pack_value(out, value):
+  """ Appends a single tagged value.
+  Args:
+    out: The bytearray to append to.
+    value: The value to append. """
+  if value is None:
+    out.append(_NONE)
+  elif value is False:
+    out.append(_FALSE)
+  elif value is True:
+    out.append(_TRUE)
+  elif isinstance(value, int):
+    raw = value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+    out.append(_INT)
+    _pack_varint(out, len(raw))
+    out += raw
+  elif isinstance(value, str):
+    try:
+      raw = value.encode("latin-1")
+      out.append(_LATIN1)
+    except UnicodeEncodeError:
+      raw = value.encode("utf-8")
+      out.append(_UTF8)
+    _pack_varint(out, len(raw))
+    out += raw
+  elif isinstance(value, (bytes, bytearray, memoryview)):
+    out.append(_BYTES)
+    _pack_varint(out, len(value))
+    out += value
+  elif isinstance(value, (list, tuple)):
+    out.append(_LIST)
+    _pack_varint(out, len(value))
+    for item in value:
+      _pack_value(out, item)
+  elif isinstance(value, dict):
+    out.append(_DICT)
+    _pack_varint(out, len(value))
+    for key, item in value.items():
+      _pack_value(out, key)
+      _pack_value(out, item)
+  else:
+    raise TypeError("Cannot serialize value of type %s." % \
+                    (type(value).__name__))
+
+def _unpack_value(data, offset, depth=0):
+  """ Reads a single tagged value.
+  Args:
+    data: The data to read from.
+    offset: The offset of the value.
+    depth: How many lists and dicts the value is nested in.
+  Returns:
+    The value, and the offset just after it. """
+  tag = data[offset]
+  offset += 1
+
+  if tag == _NONE:
+    return None, offset
+  if tag == _FALSE:
+    return False, offset
+  if tag == _TRUE:
+    return True, offset
+
+  if tag in (_LIST, _DICT):
+    if depth >= MAX_DEPTH:
+      raise ValueError("Message body is nested too deeply.")
+    count, offset = _unpack_varint(data, offset)
+    items = []
+    for _ in range(count * (2 if tag == _DICT else 1)):
+      item, offset = _unpack_value(data, offset, depth + 1)
+      items.append(item)
+    if tag == _LIST:
+      return items, offset
+
+    keys = items[::2]
+    for key in keys:
+      # Lists and dicts can't be keys, and nothing else is ever used as one.
+      if not isinstance(key, (str, int, bytes)):
+        raise ValueError("Invalid map key of type %s." % \
+                         (type(key).__name__))
+    return dict(zip(keys, items[1::2])), offset
+
+  length, offset = _unpack_varint(data, offset)
+  end = offset + length
+  if end > len(data):
+    raise ValueError("Value runs past the end of the message.")
+  raw = data[offset:end]
+
+  if tag == _INT:
+    return int.from_bytes(raw, "big", signed=True), end
+  if tag == _LATIN1:
+    return str(raw, "latin-1"), end
+  if tag == _UTF8:
+    return str(raw, "utf-8"), end
+  if tag == _BYTES:
+    return bytes(raw), end
+  raise ValueError("Unknown value tag %d." % (tag))
+
+def pack(raw_message):
+  """ Encodes a raw message in the binary format.
+  Args:
+    raw_message: The message dict.
+  Returns:
+    The encoded body, as a bytearray. """
+  out = bytearray()
+  _pack_value(out, raw_message)
+  return out
+
+def unpack(body):
+  """ Decodes a binary message body.
+  Args:
+    body: The body, as a bytes-like object.
+  Returns:
+    The message dict. """
+  view = memoryview(body)
+  try:
+    raw_message, end = _unpack_value(view, 0)
+  except IndexError:
+    raise ValueError("Message body is truncated.")
+  if end != len(view):
+    raise ValueError("Message body has %d trailing bytes." % \
+                     (len(view) - end))
+  if not isinstance(raw_message, dict):
+    raise ValueError("Message body is not a dict.")
+  return raw_message
+
+
+if __name__ == "__main__":
+  message = {"pkc": ["rsa", "gm"], "contents": b"\x00\xff", "nonce": -1}
+  assert unpack(pack(message)) == message
+
+  # A body nested deeper than MAX_DEPTH is rejected, rather than recursing
+  # until the stack runs out.
+  nested = {}
+  for _ in range(MAX_DEPTH):
+    nested = {"next": nested}
+  try:
+    unpack(pack(nested))
+  except ValueError as error:
+    print("Rejected nested body: %s" % (error))
+  else:
+    raise AssertionError("Nested body was accepted.")
+
+  # Keys that can't be hashed are rejected with a ValueError too.
+  unhashable = bytes([_DICT, 1, _LIST, 0, _NONE])
+  try:
+    unpack(unhashable)
+  except ValueError as error:
+    print("Rejected map key: %s" % (error))
+  else:
+    raise AssertionError("Unhashable key was accepted.")
+
+  hostile = bytes([_DICT, 1, _LATIN1, 0]) + bytes([_LIST, 1]) * 100000
+  try:
+    unpack(hostile)
+  except ValueError as error:
+    print("Rejected hostile body: %s" % (error))
+  else:
+    raise AssertionError("Hostile body was accepted.")
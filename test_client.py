@@ -8,27 +8,38 @@ from final import config_helper
 from final.transfer import client
 
 
-logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
-
-
 def main():
   parser = argparse.ArgumentParser("Test client script.")
   parser.add_argument("host", help="The host to connect to.")
   parser.add_argument("port", type=int, help="The port to listen on.")
   parser.add_argument("--rc4_conf", default="config/rc4.json",
                       help="RC4 configuration file.")
+  parser.add_argument("--des_conf", default="config/des.json",
+                      help="TripleDES configuration file.")
   parser.add_argument("--rsa_conf", default="config/rsa.json",
                       help="RSA configuration file.")
   parser.add_argument("--ssrsa_conf", default="config/ssrsa.json",
                       help="SSRSA configuration file.")
   parser.add_argument("--gm_conf", default="config/gm.json",
                       help="GM configuration file.")
+  parser.add_argument("--debug", action="store_true",
+                      help="Enable debug logging.")
+  parser.add_argument("--trace", action="store_true",
+                      help="Log the contents of every message on the wire.")
+  parser.add_argument("--trace_preview", type=int, default=256,
+                      help="Bytes of each message to show when tracing, or 0 "
+                           "for whole messages.")
   args = parser.parse_args()
 
+  level = logging.DEBUG if args.debug else logging.INFO
+  logging.basicConfig(level=level, stream=sys.stdout)
+  if args.trace:
+    logging.getLogger("final.transfer.wire").setLevel(logging.DEBUG)
+
   # Initialize the cryptosystems.
   config = config_helper.ConfigHelper()
   config.add_rc4(args.rc4_conf)
-  config.add_des()
+  config.add_des(args.des_conf)
   config.add_rsa(args.rsa_conf)
   config.add_ssrsa(args.ssrsa_conf)
   config.add_goldwassermicali(args.gm_conf)
@@ -36,6 +47,7 @@ def main():
   manager = config.get_manager()
 
   my_client = client.Client(args.host, args.port, manager)
+  my_client.set_trace_preview(args.trace_preview or None)
 
   # Send messages.
   while True:
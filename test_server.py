@@ -1,14 +1,30 @@
 #!/usr/bin/python3
 
 import argparse
+import asyncio
 import logging
 import sys
 
 from final import config_helper
+from final.transfer import async_server
 from final.transfer import server
+from final.transfer import tickets
 
 
-logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
+def make_manager(args):
+  """ Initializes the cryptosystems.
+  Args:
+    args: The parsed command line arguments.
+  Returns:
+    The CryptoManager to use. """
+  config = config_helper.ConfigHelper()
+  config.add_rc4(args.rc4_conf)
+  config.add_des(args.des_conf)
+  config.add_rsa(args.rsa_conf)
+  config.add_ssrsa(args.ssrsa_conf)
+  config.add_goldwassermicali(args.gm_conf)
+  config.add_blumgoldwasser()
+  return config.get_manager()
 
 
 def main():
@@ -16,27 +32,60 @@ def main():
   parser.add_argument("port", type=int, help="The port to listen on.")
   parser.add_argument("--rc4_conf", default="config/rc4.json",
                       help="RC4 configuration file.")
+  parser.add_argument("--des_conf", default="config/des.json",
+                      help="TripleDES configuration file.")
   parser.add_argument("--rsa_conf", default="config/rsa.json",
                       help="RSA configuration file.")
   parser.add_argument("--ssrsa_conf", default="config/ssrsa.json",
                       help="SSRSA configuration file.")
   parser.add_argument("--gm_conf", default="config/gm.json",
                       help="GM configuration file.")
+  parser.add_argument("--concurrent", type=int, default=None,
+                      help="Keep serving clients, this many at a time, "
+                           "instead of exiting after the first one.")
+  parser.add_argument("--workers", type=int, default=None,
+                      help="Serve clients on this many worker processes, each "
+                           "handling --concurrent clients at a time.")
+  parser.add_argument("--tickets", action="store_true",
+                      help="Issue session tickets, so that clients can "
+                           "reconnect without a full handshake. Not supported "
+                           "with --async.")
+  parser.add_argument("--async", dest="use_async", action="store_true",
+                      help="Serve any number of clients at once on an "
+                           "asyncio event loop.")
+  parser.add_argument("--debug", action="store_true",
+                      help="Enable debug logging.")
+  parser.add_argument("--trace", action="store_true",
+                      help="Log the contents of every message on the wire.")
+  parser.add_argument("--trace_preview", type=int, default=256,
+                      help="Bytes of each message to show when tracing, or 0 "
+                           "for whole messages.")
   args = parser.parse_args()
 
-  # Initialize the cryptosystems.
-  config = config_helper.ConfigHelper()
-  config.add_rc4(args.rc4_conf)
-  config.add_des()
-  config.add_rsa(args.rsa_conf)
-  config.add_ssrsa(args.ssrsa_conf)
-  config.add_goldwassermicali(args.gm_conf)
-  config.add_blumgoldwasser()
-  manager = config.get_manager()
+  level = logging.DEBUG if args.debug else logging.INFO
+  logging.basicConfig(level=level, stream=sys.stdout)
+  if args.trace:
+    logging.getLogger("final.transfer.wire").setLevel(logging.DEBUG)
+
+  manager = make_manager(args)
 
   # Run the server.
-  my_server = server.Server(args.port, manager)
-  my_server.handle_client()
+  if args.use_async:
+    my_server = async_server.AsyncServer(args.port, manager)
+    my_server.set_trace_preview(args.trace_preview or None)
+    asyncio.run(my_server.serve_forever())
+    return
+
+  ticket_cache = tickets.TicketCache() if args.tickets else None
+  my_server = server.Server(args.port, manager, ticket_cache=ticket_cache)
+  my_server.set_trace_preview(args.trace_preview or None)
+  if args.workers:
+    my_server.serve_forked(args.workers, lambda: make_manager(args),
+                           args.concurrent or 1)
+  elif args.concurrent:
+    my_server.serve_forever(args.concurrent)
+  else:
+    my_server.handle_client()
 
 
 if __name__ == "__main__":